@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import numpy as np
+from perlin_noise import (NOISE_BACKENDS, make_field, perlin_noise,
+                          perlin_noise_2d, perlin_noise_tiles,
+                          sample_fbm_bounds)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "benchmark_noise_baseline.json")
+SIZES = [(256, 256), (1024, 512), (1500, 750)]
+QUICK_SIZES = [(256, 256)]
+OCTAVES = [1, 6]
+DTYPES = [np.float64, np.float32]
+
+def measure(function, repeat=3):
+    """
+    Time a function and trace its peak memory.
+    :param function: Function without argument
+    :param repeat: Number of timed runs, the best one is kept
+    :return: (best time in seconds, peak traced memory in bytes)
+    """
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best, peak
+
+def benchmark_cases(sizes, repeat=3):
+    """
+    Benchmark perlin_noise over sizes, octave counts, dtypes and backends,
+    the per-octave reference path and one perlin_noise_2d call.
+    :param sizes: List of (width, height)
+    :param repeat: Number of timed runs per case
+    :return: Dictionary {case name: {"time", "peak", "samples_per_s"}}
+    """
+    results = {}
+
+    def record(name, function, samples):
+        elapsed, peak = measure(function, repeat)
+        results[name] = {"time": elapsed, "peak": peak,
+                         "samples_per_s": samples / elapsed}
+        print(f"{name:<48} {elapsed * 1e3:9.1f} ms {peak / 2**20:8.1f} MB "
+              f"{samples / elapsed / 1e6:7.2f} Msamples/s")
+
+    for width, height in sizes:
+        for backend in NOISE_BACKENDS:
+            field = make_field(0, backend)
+            for octaves in OCTAVES:
+                for dtype in DTYPES:
+                    name = (f"perlin_noise/{backend}/{width}x{height}/"
+                            f"o{octaves}/{np.dtype(dtype).name}")
+                    record(name, lambda: perlin_noise(width, height, scale=5,
+                                                      field=field,
+                                                      octaves=octaves,
+                                                      dtype=dtype),
+                           width * height)
+        field = make_field(0, "random")
+        name = f"perlin_noise/reference/{width}x{height}/o6/float64"
+        record(name, lambda: perlin_noise(width, height, scale=5, field=field,
+                                          fused=False),
+               width * height)
+        X, Y = np.meshgrid(np.linspace(0, 5, width, endpoint=False),
+                           np.linspace(0, 5, height, endpoint=False))
+        name = f"perlin_noise_2d/{width}x{height}"
+        record(name, lambda: perlin_noise_2d(X, Y, field=field),
+               width * height)
+    return results
+
+def spectrum_slope(noise):
+    """
+    Slope of the radially averaged power spectrum in log-log scale.
+    fBm with persistence 0.5 and lacunarity 2 loses energy with frequency,
+    so the slope must be clearly negative.
+    :param noise: 2D array
+    :return: Fitted slope
+    """
+    power = np.abs(np.fft.fftshift(np.fft.fft2(noise - noise.mean()))) ** 2
+    height, width = noise.shape
+    yy, xx = np.indices(noise.shape)
+    radius = np.hypot(xx - width // 2, yy - height // 2).astype(int)
+    radial = np.bincount(radius.ravel(), power.ravel()) / np.bincount(radius.ravel())
+    freqs = np.arange(1, min(width, height) // 2)
+    return np.polyfit(np.log(freqs), np.log(radial[freqs] + 1e-300), 1)[0]
+
+def quality_checks(width=512, height=256, tile_size=100):
+    """
+    Check the value range, the spectrum and the tile seams of every backend.
+    :param width: Width of the checked maps
+    :param height: Height of the checked maps
+    :param tile_size: Side of the tiles of the seam check
+    :return: List of failure messages (empty if everything passed)
+    """
+    failures = []
+    for backend in NOISE_BACKENDS:
+        field = make_field(0, backend)
+        noise = perlin_noise(width, height, scale=5, field=field)
+        if not np.all(np.isfinite(noise)):
+            failures.append(f"{backend}: non finite values")
+        if noise.min() != 0 or noise.max() != 1:
+            failures.append(f"{backend}: range [{noise.min()}, {noise.max()}] "
+                            "instead of [0, 1]")
+        slope = spectrum_slope(noise)
+        if slope > -1:
+            failures.append(f"{backend}: spectrum slope {slope:.2f} > -1")
+        # Tiles must match the full map computed with the same bounds
+        bounds = sample_fbm_bounds(field, scale=5)
+        full = np.zeros((height, width))
+        for row, col, tile in perlin_noise_tiles(width, height,
+                                                 tile_size=tile_size, scale=5,
+                                                 field=field, bounds=bounds):
+            full[row:row + tile.shape[0], col:col + tile.shape[1]] = tile
+        x = np.linspace(0, 1, width, endpoint=False)
+        y = np.linspace(0, 1, height, endpoint=False)
+        reference = field.sample(x[np.newaxis, :], y[:, np.newaxis], scale=5,
+                                 bounds=bounds)
+        np.clip(reference, 0, 1, out=reference)
+        seam_error = np.max(np.abs(full - reference))
+        if seam_error > 0:
+            failures.append(f"{backend}: tiles differ from the full map by "
+                            f"{seam_error}")
+        # Steps across the seams must look like steps inside the tiles
+        for axis in (0, 1):
+            steps = np.moveaxis(np.abs(np.diff(full, axis=axis)), axis, 0)
+            seams = np.arange(tile_size - 1, steps.shape[0], tile_size)
+            inside = np.delete(steps, seams, axis=0)
+            if seams.size and steps[seams].max() > 2 * inside.max():
+                failures.append(f"{backend}: discontinuity at the tile seams "
+                                f"along axis {axis}")
+        print(f"quality/{backend:<10} spectrum slope {slope:6.2f}, "
+              f"tile error {seam_error}")
+    return failures
+
+def compare(results, baseline, tolerance):
+    """
+    Find the cases slower or heavier than the baseline.
+    :param results: Output of benchmark_cases
+    :param baseline: Stored output of benchmark_cases
+    :param tolerance: Allowed relative increase of time and peak memory
+    :return: List of regression messages
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]
+        for key in ("time", "peak"):
+            if result[key] > reference[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {result[key]:.4g} > "
+                                   f"baseline {reference[key]:.4g}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Noise generation benchmark "
+                                                 "and quality checks")
+    parser.add_argument("--quick", action="store_true",
+                        help="only benchmark the smallest size")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative slowdown against the baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = benchmark_cases(QUICK_SIZES if args.quick else SIZES, args.repeat)
+    failures = quality_checks()
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    failures += compare(results, baseline, args.tolerance)
+    if args.update_baseline or not baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as file:
+            json.dump(baseline, file, indent=1, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+    for failure in failures:
+        print("FAIL", failure)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
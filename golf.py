@@ -1,12 +1,8 @@
 import pygame
 import pygame.locals
 import numpy as np
-import math
-import random
 import time
-from colorsys import hls_to_rgb
-from perlin_noise import perlin_noise
-from scipy.ndimage import zoom
+from golf_simulation import GolfSimulation, HoleQueue, vdiv
 
 pygame.init()
 
@@ -27,261 +23,201 @@ WIDTH, HEIGHT = 1500, 750
 screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
 pygame.display.set_caption("Golf")
 
-f = 1
-g = 5000*f  # Constante de gravité
-vinitmax = 3*f # vitesse maximale
-vdiv = 75/vinitmax
-dt = 0.75
-coeff=2
-zoom_factor = 75
-scale = 5
-friction = 1-5e-2
-axy_abs_min = 1e-5
-
-def calculate_gradient(matrix, i, j):
-    m, n = matrix.shape
-    di, dj = 0, 0
-
-    # Partial derivative with respect to i
-    if 0 < i < m-1:
-        di = (matrix[i+1, j] - matrix[i-1, j]) / 2
-    elif i == 0:
-        di = matrix[i+1, j] - matrix[i, j]
-    elif i == m-1:
-        di = matrix[i, j] - matrix[i-1, j]
-
-    # Partial derivative with respect to j
-    if 0 < j < n-1:
-        dj = (matrix[i, j+1] - matrix[i, j-1]) / 2
-    elif j == 0:
-        dj = matrix[i, j+1] - matrix[i, j]
-    elif j == n-1:
-        dj = matrix[i, j] - matrix[i, j-1]
-
-    return np.array([di, dj])
-
-# Classe pour les objets gravitationnels (joueurs et planètes)
-class RoundObject:
-    def __init__(self, x, y, radius, color):
-        self.x = x
-        self.y = y
-        self.radius = radius
-        self.color = color
-
-    def draw(self):
-        pygame.draw.circle(screen, self.color, (int(self.x), int(self.y)), self.radius)
-
-# Classe pour les joueurs
-class Player(RoundObject):
-    def __init__(self, x, y, radius, color):
-        super().__init__(x, y, radius, color)
-        self.score = 0
-        self.vx = 0  # Vitesse horizontale initiale
-        self.vy = 0  # Vitesse verticale initiale
-        self.missed_shots = []  # Liste des tirs manqués
-        self.last_shot_time = 0  # Temps du dernier tir
-
-    def rotate_left(self):
-        self.angle -= math.radians(5)
-
-    def rotate_right(self):
-        self.angle += math.radians(5)
-
-    def shoot(self, vx, vy, click_pos):
-        # Créer un tir à partir de la position actuelle du joueur
-        v = np.array([vx, vy])
-        bullet_x = self.x + (self.radius + 20) * vx / np.linalg.norm(v)
-        bullet_y = self.y + (self.radius + 20) * vy / np.linalg.norm(v)
-        return Bullet(bullet_x, bullet_y, vx, vy, self, self.color, click_pos)
-
-# Classe pour les balles
-class Bullet:
-    def __init__(self, x, y, vx, vy, player, color, click_pos):
-        self.x = x
-        self.y = y
-        v = np.linalg.norm([vx, vy])
-        if v > vinitmax:
-            vx = vinitmax*vx/v
-            vy = vinitmax*vy/v
-        self.vx = vx
-        self.vy = vy
-        self.player = player
-        self.color = color
-        self.traj = [(self.x, self.y)]
-        self.click_pos = click_pos
-        self.n_moves = 0
-        
-    def update(self, altitude_matrix):
-        # Mettre à jour la position de la balle en fonction de son angle et de sa vitesse
-        ax, ay = calculate_gradient(altitude_matrix, int(self.y), int(self.x))
-        if ax < 0:
-            ax = min(ax, -axy_abs_min)
-        else:
-            ax = max(ax, +axy_abs_min)
-        if ay < 0:
-            ay = min(ay, -axy_abs_min)
-        else:
-            ay = max(ay, +axy_abs_min)
-        vx = self.vx*dt + g*ax*dt**2/2
-        vy = self.vy*dt + g*ay*dt**2/2
-        vx = vx*friction
-        vy = vy*friction
-        v = np.linalg.norm([vx, vy])
-        for i in range(1, 2+1, 1):
-            if v <= i:
-                self.vx = self.vx*1.004
-                self.vy = self.vy*1.004
-        vx = self.vx*dt + g*ax*dt**2/2
-        vy = self.vy*dt + g*ay*dt**2/2
-        vx = vx*friction
-        vy = vy*friction
-        self.x = self.x + vx
-        self.y = self.y + vy
-        self.traj.append((self.x, self.y))
-        self.n_moves += 1
-
-    def draw(self):
-        pygame.draw.circle(screen, self.color, (int(self.x), int(self.y)), 3)
-        if len(bullet.traj) > 1:
-            pygame.draw.lines(screen, TRAJ_COLOR, False, bullet.traj, 1)
-
-    def check_collision(self, circle):
-        distance = math.hypot(self.x - circle.x, self.y - circle.y)
-        return distance < circle.radius
-    
-# Champ de hauteur
-
-# Générer le bruit de Perlin
-
-def get_altitude_color(altitude_matrix):
-    # Conversion de la matrice en couleurs HSV
-    # Ajustement de la luminosité proportionnelle aux valeurs de la matrice
-    v = (altitude_matrix * 255).astype(np.uint8)
-    # Création de l'image colorée en RVB à partir des valeurs HSV
-    image = np.zeros((WIDTH, HEIGHT, 3), dtype=np.uint8)
-    hue_degraded = 1#♣np.random.random() < 0.2
-    for y in range(WIDTH):
-        for x in range(HEIGHT):
-            hue = (1 - altitude_matrix[x, y]) * 10  # Convertir de 270° (bleu/violet) à 0° (rouge)
-            r, g, b = hls_to_rgb(hue, abs(altitude_matrix[x, y]*0.5), 0.9)
-            image[y, x, 0] = int(r * 255)
-            image[y, x, 1] = int(g * 255)
-            image[y, x, 2] = int(b * 255)
-    return image
-
-altitude_matrix = zoom(perlin_noise(WIDTH//zoom_factor, HEIGHT//zoom_factor, scale=scale), zoom_factor)
-image = get_altitude_color(altitude_matrix)
-
-# Initialisation des joueurs 
-
-nx = 5
-ny = 3
-player_radius = 15
-player0 = Player(x=WIDTH // nx,
-                 y=HEIGHT // ny,
-                 radius=player_radius,
-                 color=WHITE)
-player1 = Player(x=WIDTH * (nx-1) // nx,
-                 y=HEIGHT * (ny-1) // ny,
-                 radius=player_radius,
-                 color=WHITE)
-players_list = [player0, player1]
-
-def dist(x1, y1, x2, y2):
-    return np.sqrt((x1-x2)**2+(y1-y2)**2)
+game_seed = None  # un entier pour rejouer la même suite de trous (relus dans le cache de bruit)
+
+def hls_to_rgb_array(h, l, s):
+    # Version vectorisée de colorsys.hls_to_rgb (mêmes opérations, donc mêmes valeurs)
+    h, l, s = np.broadcast_arrays(np.asarray(h, dtype=float), np.asarray(l, dtype=float), np.asarray(s, dtype=float))
+    m2 = np.where(l <= 0.5, l * (1.0 + s), l + s - (l * s))
+    m1 = 2.0 * l - m2
+    channels = []
+    for hue in (h + 1/3, h, h - 1/3):
+        hue = hue % 1.0
+        channel = np.select([hue < 1/6, hue < 0.5, hue < 2/3],
+                            [m1 + (m2 - m1) * hue * 6.0, m2, m1 + (m2 - m1) * (2/3 - hue) * 6.0],
+                            m1)
+        channels.append(np.where(s == 0.0, l, channel))
+    return channels
+
+def altitude_colors(altitude):
+    # Teinte de 270° (bleu/violet) à 0° (rouge), luminosité proportionnelle à l'altitude
+    hue = (1 - altitude) * 10
+    r, g, b = hls_to_rgb_array(hue, np.abs(altitude * 0.5), 0.9)
+    return (np.stack((r, g, b), axis=-1) * 255).astype(np.uint8)
+
+altitude_palettes = {}
+
+def get_altitude_palette(palette_size):
+    # Table des couleurs de palette_size altitudes régulièrement espacées, calculée une seule fois
+    if palette_size not in altitude_palettes:
+        altitude_palettes[palette_size] = altitude_colors(np.linspace(0, 1, palette_size))
+    return altitude_palettes[palette_size]
+
+def get_altitude_color(altitude_matrix, palette_size=4096):
+    # palette_size=None calcule la couleur exacte de chaque pixel,
+    # sinon l'altitude est quantifiée et lue dans une palette
+    if palette_size is None:
+        colors = altitude_colors(altitude_matrix)
+    else:
+        index = np.rint(altitude_matrix * (palette_size - 1)).astype(np.intp)
+        np.clip(index, 0, palette_size - 1, out=index)
+        colors = get_altitude_palette(palette_size)[index]
+    # pygame.surfarray attend une image (largeur, hauteur, 3)
+    return np.ascontiguousarray(colors.transpose(1, 0, 2))
+
+def draw_player(player, color):
+    pygame.draw.circle(screen, color, (int(player.x), int(player.y)), player.radius)
+
+def draw_balls(swarm):
+    for k in swarm.live():
+        pygame.draw.circle(screen, player_colors[swarm.owner[k]], (int(swarm.x[k]), int(swarm.y[k])), 3)
+        if swarm.n_moves[k] > 0:
+            pygame.draw.lines(screen, TRAJ_COLOR, False, swarm.trajectory(k), 1)
+
+def draw_cross(surface, cross_center, cross_size=5):
+    horizontal_start = (cross_center[0] - cross_size, cross_center[1])
+    horizontal_end = (cross_center[0] + cross_size, cross_center[1])
+    vertical_start = (cross_center[0], cross_center[1] - cross_size)
+    vertical_end = (cross_center[0], cross_center[1] + cross_size)
+    pygame.draw.line(surface, BLACK, horizontal_start, horizontal_end, 3)
+    pygame.draw.line(surface, BLACK, vertical_start, vertical_end, 3)
+    pygame.draw.line(surface, WHITE, horizontal_start, horizontal_end, 1)
+    pygame.draw.line(surface, WHITE, vertical_start, vertical_end, 1)
+
+# Calque des trajectoires terminées
+class TrajectoryLayer:
+    # Les trajectoires sont rangées dans des tableaux numpy préalloués, et dessinées
+    # une seule fois sur une surface transparente gardée d'une image à l'autre
+    # La surface n'est redessinée en entier que quand les couleurs pâlissent
+    def __init__(self, capacity=64, max_points=1002, min_norm=100):
+        self.min_norm = min_norm  # les trajectoires plus sombres ne sont plus dessinées
+        self.size = 0
+        self.traj = np.zeros((capacity, max_points, 2), dtype=np.float32)
+        self.length = np.zeros(capacity, dtype=np.intp)
+        self.pos = np.zeros((capacity, 2))
+        self.color = np.zeros((capacity, 3))
+        self.surface = None
+        self.dirty = True
+
+    def reserve(self, capacity, max_points):
+        old, old_points = self.traj.shape[:2]
+        if capacity <= old and max_points <= old_points:
+            return
+        capacity = max(capacity, old if capacity <= old else 2 * old)
+        traj = np.zeros((capacity, max(max_points, old_points), 2), dtype=np.float32)
+        traj[:old, :old_points] = self.traj
+        self.traj = traj
+        for name in ("length", "pos", "color"):
+            array = getattr(self, name)
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:old] = array
+            setattr(self, name, grown)
+
+    def add(self, swarm, finished):
+        # Copier les trajectoires des balles finished et les dessiner sur le calque
+        n = len(finished)
+        if n == 0:
+            return
+        length = swarm.n_moves[finished] + 1
+        start, stop = self.size, self.size + n
+        self.reserve(stop, int(length.max()))
+        self.traj[start:stop, :length.max()] = swarm.traj[finished, :length.max()]
+        self.length[start:stop] = length
+        self.pos[start:stop] = swarm.click_pos[finished]
+        self.color[start:stop] = TRAJ_COLOR
+        self.size = stop
+        if not self.dirty and self.surface is not None:
+            for k in range(start, stop):
+                self.draw_trajectory(k)
+
+    def fade(self, factor=0.95):
+        # Pâlir toutes les trajectoires, celles devenues trop sombres sont oubliées
+        self.color[:self.size] *= factor
+        keep = np.flatnonzero(np.linalg.norm(self.color[:self.size], axis=-1) > self.min_norm)
+        for name in ("traj", "length", "pos", "color"):
+            array = getattr(self, name)
+            array[:len(keep)] = array[keep]
+        self.size = len(keep)
+        self.dirty = True
+
+    def clear(self):
+        self.size = 0
+        self.dirty = True
+
+    def draw_trajectory(self, k):
+        color = self.color[k]
+        if self.length[k] > 1 and np.linalg.norm(color) > self.min_norm:
+            # Trajectoire
+            pygame.draw.lines(self.surface, tuple(color.astype(int)), False,
+                              self.traj[k, :self.length[k]].tolist(), 1)
+            # Croix
+            draw_cross(self.surface, tuple(self.pos[k]))
+
+    def draw(self, target):
+        if self.surface is None or self.surface.get_size() != target.get_size():
+            self.surface = pygame.Surface(target.get_size(), pygame.SRCALPHA)
+            self.dirty = True
+        if self.dirty:
+            self.surface.fill((0, 0, 0, 0))
+            for k in range(self.size):
+                self.draw_trajectory(k)
+            self.dirty = False
+        target.blit(self.surface, (0, 0))
+
+# Calque du terrain
+class TerrainLayer:
+    # Surface du terrain construite une fois par trou (et à chaque changement de taille
+    # de la fenêtre) : à chaque image, le fond n'est plus qu'une copie de surface
+    def __init__(self):
+        self.surface = None
+        self.key = None
+
+    def draw(self, target, simulation):
+        key = (simulation.hole, target.get_size())
+        if key != self.key:
+            image = simulation.terrain.colors(*target.get_size())
+            if image is None:
+                image = get_altitude_color(simulation.altitude_matrix)
+            else:
+                image = image.transpose(1, 0, 2)
+            self.surface = pygame.surfarray.make_surface(image).convert()
+            self.key = key
+        target.blit(self.surface, (0, 0))
+
+def prepare_hole(hole):
+    # Couleurs de chaque niveau de la pyramide du terrain, en (hauteur, largeur, 3)
+    hole.color_levels = [get_altitude_color(altitude_matrix).transpose(1, 0, 2)
+                         for altitude_matrix, _ in hole.levels]
+
+# Toute la physique est dans GolfSimulation, ce fichier ne fait que l'afficher
+# Les trous suivants sont préparés en arrière-plan (terrain, pentes et couleurs)
+holes = HoleQueue(WIDTH, HEIGHT, size=2, prepare=prepare_hole, seed=game_seed)
+simulation = GolfSimulation(WIDTH, HEIGHT, holes=holes)
+terrain = TerrainLayer()
+player0, player1 = simulation.players
+player_colors = [WHITE, WHITE]
 
 # Boucle principale du jeu
 running = True
 clock = pygame.time.Clock()
 
-who_plays = 0
-
-bullets_list = []
-bullet_traj_list = []
-old_crosses = []
-n_test = 0
+trajectories = TrajectoryLayer()
 
 while running:
-    screen.blit(pygame.surfarray.make_surface(image), (0, 0))
     WIDTH, HEIGHT = screen.get_size()
+    simulation.resize(WIDTH, HEIGHT)
+    terrain.draw(screen, simulation)
     keys = pygame.key.get_pressed()
 
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             running = False
-        if event.type == pygame.MOUSEBUTTONDOWN and len(bullets_list) == 0:
-            vinitmax = vinitmax*1.05
-            for i in range(len(bullet_traj_list)):
-                bullet_traj_list[i]['color'] = np.array(bullet_traj_list[i]['color'])*0.95
-            mouse_x, mouse_y = event.pos
-            shooter = players_list[who_plays]
-            d = dist(x1=shooter.x, y1=shooter.y, x2=mouse_x, y2=mouse_y) - shooter.radius
-            # Additive
-            h = 0.5
-            l = np.arange(-h, 2*h, h)
-            vxvy_list = []
-            for i in l:
-                for j in l:
-                    vx=mouse_x-shooter.x
-                    vy=mouse_y-shooter.y
-                    vx = vx+i
-                    vy = vy+j
-                    vxvy_list.append((vx+i, vy+j))
-                    assert not np.isnan(vx)
-                    assert not np.isnan(vy)
-            # Multiplicative
-            """
-            h = 0.05
-            np.arange(1-h, 1+2*h, h)
-            vxvy_list = []
-            for i in l:
-                for j in l:
-                    vx=mouse_x-shooter.x
-                    vy=mouse_y-shooter.y
-                    vx = vx*i
-                    vy = vy*j
-                    vxvy_list.append((vx, vy))
-                    assert not np.isnan(vx)
-                    assert not np.isnan(vy)
-            """
-            for vxvy in vxvy_list:
-                vx, vy = vxvy
-                bullet = shooter.shoot(vx=vx/vdiv, vy=vy/vdiv, click_pos=event.pos)
-                bullets_list.append(bullet)
-            who_plays = (who_plays+1)%2
-            n_test += 1
-    
-    for bullet in bullets_list:
-        bullet.draw()
-        if bullet.x < 0 or bullet.y < 0 or bullet.x > WIDTH or bullet.y > HEIGHT:
-            bullets_list.remove(bullet)
-            bullet_traj_list.append({"traj":bullet.traj,
-                                     "pos":bullet.click_pos,
-                                     "color":TRAJ_COLOR})
-                
-    for traj_pos in bullet_traj_list:
-        traj = traj_pos['traj']
-        pos = traj_pos['pos']
-        color = traj_pos["color"]
-        if len(traj) > 1:
-            # Trajectoire
-            line_width = 1
-            if np.linalg.norm(color) > 200:
-                line_width = 1
-            if np.linalg.norm(color) > 100:
-                pygame.draw.lines(screen, color, False, traj, line_width)
-                # Croix
-                cross_center = pos
-                cross_size = 5
-                horizontal_start = (cross_center[0] - cross_size, cross_center[1])
-                horizontal_end = (cross_center[0] + cross_size, cross_center[1])
-                vertical_start = (cross_center[0], cross_center[1] - cross_size)
-                vertical_end = (cross_center[0], cross_center[1] + cross_size)
-                pygame.draw.line(screen, BLACK, horizontal_start, horizontal_end, 3)
-                pygame.draw.line(screen, BLACK, vertical_start, vertical_end, 3)
-                pygame.draw.line(screen, WHITE, horizontal_start, horizontal_end, 1)
-                pygame.draw.line(screen, WHITE, vertical_start, vertical_end, 1)
-            
+        if event.type == pygame.MOUSEBUTTONDOWN and len(simulation.swarm) == 0:
+            trajectories.fade(0.95)
+            simulation.shoot(event.pos)
+
+    trajectories.draw(screen)
+
     # Définir le texte à afficher
     text = f"{player0.score} | {player1.score}"
     font_size = 36
@@ -291,15 +227,16 @@ while running:
     text_surface = font.render(text, True, (255, 255, 255))
     screen.blit(text_surface, (10, 10))  # Position (10, 10)
 
-    player0.draw()
-    player1.draw()
+    draw_player(player0, player_colors[0])
+    draw_player(player1, player_colors[1])
+    vinitmax = simulation.vinitmax
     
     rectangle0 = pygame.Rect(player0.x-vdiv*vinitmax,
                              player0.y-vdiv*vinitmax,
                              2*vdiv*vinitmax,
                              2*vdiv*vinitmax)
     pygame.draw.ellipse(screen,
-                        player0.color,
+                        player_colors[0],
                         rectangle0,
                         width=1)
     rectangle1 = pygame.Rect(player1.x-vdiv*vinitmax,
@@ -307,11 +244,11 @@ while running:
                              2*vdiv*vinitmax,
                              2*vdiv*vinitmax)
     pygame.draw.ellipse(screen,
-                        player1.color,
+                        player_colors[1],
                         rectangle1,
                         width=1)
     
-    if who_plays == 0:
+    if simulation.who_plays == 0:
         pygame.draw.circle(screen, BLACK, (int(player0.x), int(player0.y)), 2*player0.radius//3+2)
         pygame.draw.circle(screen, RED, (int(player0.x), int(player0.y)), 2*player0.radius//3-2)
         pygame.draw.circle(screen, BLACK, (int(player1.x), int(player1.y)), 2*player1.radius//3-2)
@@ -321,53 +258,14 @@ while running:
         pygame.draw.circle(screen, BLACK, (int(player0.x), int(player0.y)), 2*player0.radius//3-2)
 
     # Mettre à jour et dessiner les balles des joueurs
-    collision_player_0 = False
-    collision_player_1 = False
-    for bullet in bullets_list:
-        if 0 < bullet.x < WIDTH and 0 < bullet.y < HEIGHT:
-            bullet.update(altitude_matrix)
-        else:
-            bullets_list.remove(bullet)
-            bullet_traj_list.append({"traj":bullet.traj,
-                                     "pos":bullet.click_pos,
-                                     "color":TRAJ_COLOR})
-        if bullet.n_moves > 1000 or np.linalg.norm(np.array([bullet.vx, bullet.vy])) < 0.1:
-            bullets_list.remove(bullet)
-            bullet_traj_list.append({"traj":bullet.traj,
-                                     "pos":bullet.click_pos,
-                                     "color":TRAJ_COLOR})
-        if len(bullet.traj) > 100:
-            if dist(bullet.traj[-100][0], bullet.traj[-100][1],
-                    bullet.traj[-1][0], bullet.traj[-1][1]) < 10:
-                bullets_list.remove(bullet)
-                bullet_traj_list.append({"traj":bullet.traj,
-                                         "pos":bullet.click_pos,
-                                         "color":TRAJ_COLOR})
-        if len(bullet.traj) > 200:
-            if dist(bullet.traj[-200][0], bullet.traj[-200][1],
-                    bullet.traj[-1][0], bullet.traj[-1][1]) < 25:
-                bullets_list.remove(bullet)
-                bullet_traj_list.append({"traj":bullet.traj,
-                                         "pos":bullet.click_pos,
-                                         "color":TRAJ_COLOR})
-        bullet.draw()
-        if bullet.check_collision(player1):
-            collision_player_1 = True
-        if bullet.check_collision(player0):
-            collision_player_0 = True
-    if collision_player_0 or collision_player_1:
-        vinitmax = 3*f
-        bullet_traj_list = []
-        bullets_list = []
-        n_test = 0
-        altitude_matrix = zoom(perlin_noise(WIDTH//zoom_factor, HEIGHT//zoom_factor, scale=scale), zoom_factor)
-        image = get_altitude_color(altitude_matrix)
-    if collision_player_0:
-        player1.score += 1
-        who_plays = 0
-    if collision_player_1:
-        player0.score += 1
-        who_plays = 1
+    hole = simulation.hole
+    finished, scorer = simulation.step()
+    if simulation.hole != hole:
+        # Nouveau trou : les balles de l'ancien ne sont pas dessinées
+        trajectories.clear()
+    else:
+        trajectories.add(simulation.swarm, finished)
+    draw_balls(simulation.swarm)
         
     pygame.display.flip()
     clock.tick(60)
@@ -377,4 +275,5 @@ while running:
     
     time.sleep(0.0001)
 
+holes.close()
 pygame.quit()
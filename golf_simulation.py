@@ -0,0 +1,411 @@
+import queue
+import threading
+import numpy as np
+from perlin_noise import make_field
+from noise_cache import default_cache
+
+# Cœur du jeu de golf, sans pygame : terrain, balles, trous et score
+# Le rendu (golf.py) ne fait que lire cet état et transmettre les clics
+
+f = 1
+g = 5000*f  # Constante de gravité
+vinitmax = 3*f # vitesse maximale
+vdiv = 75/vinitmax
+dt = 0.75
+scale = 5
+terrain_octaves = 2
+slope_dtype = np.float32  # np.float64 pour une pente plus précise
+noise_backend = "random"  # voir perlin_noise.backend_throughput
+friction = 1-5e-2
+axy_abs_min = 1e-5
+
+def dist(x1, y1, x2, y2):
+    return np.sqrt((x1-x2)**2+(y1-y2)**2)
+
+def generate_terrain(width, height, seed=None, cache=True):
+    # Le bruit est évalué directement à la résolution de la fenêtre (plus de zoom),
+    # avec ses dérivées analytiques dans la même passe
+    # Le terrain ne dépend que de ses paramètres : avec cache=True, on le garde sur disque
+    # (seulement utile si la même graine revient, voir HoleQueue)
+    field = make_field(seed, noise_backend)
+
+    def compute():
+        return np.stack(field.sample(np.arange(width)[np.newaxis, :] / width,
+                                     np.arange(height)[:, np.newaxis] / height,
+                                     scale=scale, octaves=terrain_octaves,
+                                     derivatives=True)).astype(np.float32)
+
+    if cache:
+        params = dict(kind="golf_terrain", seed=field.seed, width=width, height=height,
+                      scale=scale, octaves=terrain_octaves, persistence=0.5,
+                      lacunarity=2.0, backend=noise_backend, dtype="float32")
+        raw = default_cache().get(params, compute)
+    else:
+        raw = compute()
+    low, high = np.min(raw[0]), np.max(raw[0])
+    altitude_matrix = (raw[0] - low) / (high - low)
+    # Pente en altitude par pixel, (hauteur, largeur, 2), calculée une fois par trou
+    slope_field = np.stack((raw[1] / ((high - low) * width),
+                            raw[2] / ((high - low) * height)), axis=-1).astype(slope_dtype)
+    return altitude_matrix, slope_field
+
+def sample_slope(slope_field, x, y):
+    # Interpolation bilinéaire de la pente aux points (x, y), en pixels
+    height, width, _ = slope_field.shape
+    x = np.clip(np.asarray(x, dtype=float), 0.0, width - 1.0)
+    y = np.clip(np.asarray(y, dtype=float), 0.0, height - 1.0)
+    j = np.minimum(x.astype(np.intp), width - 2)
+    i = np.minimum(y.astype(np.intp), height - 2)
+    fx = (x - j)[..., np.newaxis]
+    fy = (y - i)[..., np.newaxis]
+    slope = ((1 - fx) * (1 - fy) * slope_field[i, j] + fx * (1 - fy) * slope_field[i, j+1]
+             + (1 - fx) * fy * slope_field[i+1, j] + fx * fy * slope_field[i+1, j+1])
+    return slope[..., 0], slope[..., 1]
+
+def resample(array, width, height):
+    # Rééchantillonnage bilinéaire d'un tableau (hauteur, largeur, ...) en (height, width),
+    # les centres des pixels restant alignés
+    src_height, src_width = array.shape[:2]
+    if (src_width, src_height) == (width, height):
+        return array
+    out = array if array.dtype.kind == "f" else array.astype(np.float32)
+    for axis, n_src, n_dst in ((0, src_height, height), (1, src_width, width)):
+        if n_src == n_dst:
+            continue
+        pos = np.clip((np.arange(n_dst) + 0.5) * n_src / n_dst - 0.5, 0, n_src - 1)
+        i0 = np.minimum(pos.astype(np.intp), max(n_src - 2, 0))
+        i1 = np.minimum(i0 + 1, n_src - 1)
+        w = (pos - i0).astype(out.dtype).reshape((-1,) + (1,) * (out.ndim - axis - 1))
+        out = np.take(out, i0, axis=axis) * (1 - w) + np.take(out, i1, axis=axis) * w
+    if array.dtype.kind != "f":
+        out = np.rint(out).astype(array.dtype)
+    return out
+
+def downsample(array):
+    # Moyenne par blocs de 2x2 pixels (la dernière ligne ou colonne impaire est ignorée)
+    height, width = array.shape[0] // 2, array.shape[1] // 2
+    blocks = array[:2*height, :2*width].reshape((height, 2, width, 2) + array.shape[2:])
+    return blocks.mean(axis=(1, 3), dtype=np.float64).astype(array.dtype)
+
+# Un trou : le terrain et tout ce qui en est calculé une fois pour toutes
+class Hole:
+    # Le terrain est généré à la taille width x height, puis réduit de moitié en moitié
+    # (pyramide, comme les mipmaps) ; toute taille de fenêtre est servie par
+    # rééchantillonnage du niveau le plus proche, pour la physique comme pour le rendu
+    # Seuls les trous de graine donnée passent par le cache de bruit : une graine tirée
+    # au hasard ne reviendra pas
+    def __init__(self, width, height, seed=None, min_size=32):
+        cache = seed is not None
+        if seed is None:
+            seed = np.random.randint(2**31)
+        self.seed = seed
+        self.width = width
+        self.height = height
+        altitude_matrix, slope_field = generate_terrain(width, height, seed, cache=cache)
+        # Niveaux (altitude, pente), la pente étant exprimée par pixel du niveau
+        self.levels = [(altitude_matrix, slope_field)]
+        while min(altitude_matrix.shape) >= 2 * min_size:
+            altitude_matrix = downsample(altitude_matrix)
+            slope_field = downsample(slope_field) * 2
+            self.levels.append((altitude_matrix, slope_field))
+        self.color_levels = None  # images du terrain par niveau, remplies par le rendu (voir HoleQueue)
+
+    @property
+    def altitude_matrix(self):
+        return self.levels[0][0]
+
+    @property
+    def slope_field(self):
+        return self.levels[0][1]
+
+    def level_for(self, width, height):
+        # Plus petit niveau au moins aussi grand que la fenêtre (le plus grand sinon)
+        for k in range(len(self.levels) - 1, -1, -1):
+            level_height, level_width = self.levels[k][0].shape
+            if level_width >= width and level_height >= height:
+                return k
+        return 0
+
+    def resample(self, width, height):
+        # Altitude et pente (par pixel de la fenêtre) à la taille width x height
+        altitude_matrix, slope_field = self.levels[self.level_for(width, height)]
+        level_height, level_width = altitude_matrix.shape
+        slope = resample(slope_field, width, height)
+        if (level_width, level_height) != (width, height):
+            slope = slope * np.array([level_width / width, level_height / height], dtype=slope.dtype)
+        return resample(altitude_matrix, width, height), slope
+
+    def colors(self, width, height):
+        # Image (hauteur, largeur, 3) du terrain à la taille width x height, ou None
+        if self.color_levels is None:
+            return None
+        return resample(self.color_levels[self.level_for(width, height)], width, height)
+
+# File des prochains trous
+class HoleQueue:
+    # Un fil d'exécution en arrière-plan prépare les size prochains trous, pour que
+    # le changement de trou ne bloque pas le jeu ; la mémoire reste bornée par size
+    # Grâce à leur pyramide, les trous préparés servent quelle que soit la taille de la fenêtre
+    # prepare(hole), si donné, est aussi appelé en arrière-plan (couleurs du terrain...)
+    # seed : graine de la partie ; les trous suivent alors toujours la même suite de graines,
+    # et sont relus dans le cache de bruit d'une partie à l'autre (hasard si None)
+    def __init__(self, width, height, size=2, prepare=None, seed=None):
+        self.width = width
+        self.height = height
+        self.prepare = prepare
+        self.seeds = None if seed is None else np.random.default_rng(seed)
+        self.holes = queue.Queue(maxsize=size)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def make_hole(self, width, height, seed=None):
+        hole = Hole(width, height, seed)
+        if self.prepare is not None:
+            self.prepare(hole)
+        return hole
+
+    def next_seed(self):
+        if self.seeds is None:
+            return None
+        return int(self.seeds.integers(2**31))
+
+    def run(self):
+        while not self.stopped.is_set():
+            hole = self.make_hole(self.width, self.height, self.next_seed())
+            while not self.stopped.is_set():
+                try:
+                    self.holes.put(hole, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def resize(self, width, height):
+        # Taille de base des trous préparés ensuite
+        self.width = width
+        self.height = height
+
+    def get(self):
+        # Prochain trou : on attend celui en cours de préparation, pour garder l'ordre
+        # des graines (calculé sur place seulement si le fil d'exécution s'est arrêté)
+        while True:
+            try:
+                return self.holes.get(timeout=0.1)
+            except queue.Empty:
+                if not self.thread.is_alive():
+                    return self.make_hole(self.width, self.height, self.next_seed())
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+# Classe pour les joueurs (les trous)
+class Player:
+    def __init__(self, x, y, radius):
+        self.x = x
+        self.y = y
+        self.radius = radius
+        self.score = 0
+
+    def launch_position(self, vx, vy):
+        # Les tirs partent du bord du joueur, dans la direction de la vitesse
+        v = np.hypot(vx, vy)
+        return (self.x + (self.radius + 20) * vx / v,
+                self.y + (self.radius + 20) * vy / v)
+
+    def check_collision(self, x, y):
+        return dist(x, y, self.x, self.y) < self.radius
+
+# Ensemble des balles en vol
+class BallSwarm:
+    # Une balle par indice : positions, vitesses, nombre de pas et état sont rangés
+    # dans des tableaux numpy, et toutes les balles avancent en une seule opération
+    def __init__(self, capacity=16, max_moves=1000):
+        self.max_moves = max_moves
+        self.size = 0
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.n_moves = np.zeros(capacity, dtype=np.intp)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.owner = np.zeros(capacity, dtype=np.intp)
+        self.click_pos = np.zeros((capacity, 2))
+        # Trajectoires complètes, une ligne par balle (au plus max_moves+1 pas)
+        self.traj = np.zeros((capacity, max_moves + 2, 2), dtype=np.float32)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.alive[:self.size]))
+
+    def live(self):
+        return np.flatnonzero(self.alive[:self.size])
+
+    def reserve(self, capacity):
+        # Agrandir les tableaux (en doublant) pour contenir capacity balles
+        old = len(self.x)
+        if capacity <= old:
+            return
+        capacity = max(capacity, 2 * old)
+        for name in ("x", "y", "vx", "vy", "n_moves", "alive", "owner", "click_pos", "traj"):
+            array = getattr(self, name)
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:old] = array
+            setattr(self, name, grown)
+
+    def add(self, x, y, vx, vy, owner=0, click_pos=(0, 0), vmax=vinitmax):
+        # Ajouter des balles, la vitesse initiale est limitée à vmax
+        x, y, vx, vy = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (x, y, vx, vy)))
+        if len(self) == 0:
+            self.size = 0
+        start, stop = self.size, self.size + x.size
+        self.reserve(stop)
+        v = np.hypot(vx, vy)
+        over = v > vmax
+        self.x[start:stop] = x.ravel()
+        self.y[start:stop] = y.ravel()
+        self.vx[start:stop] = np.where(over, vmax * vx / np.where(over, v, 1), vx).ravel()
+        self.vy[start:stop] = np.where(over, vmax * vy / np.where(over, v, 1), vy).ravel()
+        self.n_moves[start:stop] = 0
+        self.alive[start:stop] = True
+        self.owner[start:stop] = owner
+        self.click_pos[start:stop] = click_pos
+        self.traj[start:stop, 0, 0] = self.x[start:stop]
+        self.traj[start:stop, 0, 1] = self.y[start:stop]
+        self.size = stop
+
+    def clear(self):
+        self.alive[:] = False
+        self.size = 0
+
+    def step(self, slope_field, width, height):
+        # Faire avancer toutes les balles en vol d'un pas
+        # Renvoie (indices des balles traitées, indices des balles arrêtées à ce pas)
+        idx = self.live()
+        inside = (0 < self.x[idx]) & (self.x[idx] < width) & (0 < self.y[idx]) & (self.y[idx] < height)
+        moving = idx[inside]
+        d_dx, d_dy = sample_slope(slope_field, self.x[moving], self.y[moving])
+        # Même convention que l'ancien gradient par différences finies (ligne, colonne)
+        ax = np.where(d_dy < 0, np.minimum(d_dy, -axy_abs_min), np.maximum(d_dy, axy_abs_min))
+        ay = np.where(d_dx < 0, np.minimum(d_dx, -axy_abs_min), np.maximum(d_dx, axy_abs_min))
+        vx = self.vx[moving]
+        vy = self.vy[moving]
+        v = np.hypot((vx*dt + g*ax*dt**2/2)*friction, (vy*dt + g*ay*dt**2/2)*friction)
+        # Les balles lentes sont relancées (une ou deux fois)
+        for i in range(1, 2+1, 1):
+            boost = v <= i
+            vx = np.where(boost, vx*1.004, vx)
+            vy = np.where(boost, vy*1.004, vy)
+        self.vx[moving] = vx
+        self.vy[moving] = vy
+        self.x[moving] += (vx*dt + g*ax*dt**2/2)*friction
+        self.y[moving] += (vy*dt + g*ay*dt**2/2)*friction
+        self.n_moves[moving] += 1
+        self.traj[moving, self.n_moves[moving], 0] = self.x[moving]
+        self.traj[moving, self.n_moves[moving], 1] = self.y[moving]
+        # Balles sorties de l'écran, trop longues, trop lentes ou bloquées
+        n_moves = self.n_moves[idx]
+        x = self.x[idx]
+        y = self.y[idx]
+        finished = ~inside | (n_moves > self.max_moves) | (np.hypot(self.vx[idx], self.vy[idx]) < 0.1)
+        for window, min_dist in ((100, 10), (200, 25)):
+            old = self.traj[idx, np.maximum(n_moves + 1 - window, 0)]
+            finished |= (n_moves + 1 > window) & (dist(old[:, 0], old[:, 1], x, y) < min_dist)
+        finished = idx[finished]
+        self.alive[finished] = False
+        return idx, finished
+
+    def trajectory(self, k):
+        return self.traj[k, :self.n_moves[k] + 1].tolist()
+
+    def check_collision(self, idx, player):
+        return bool(np.any(player.check_collision(self.x[idx], self.y[idx])))
+
+# Partie complète, utilisable sans fenêtre
+class GolfSimulation:
+    def __init__(self, width=1500, height=750, seed=None, nx=5, ny=3, player_radius=15,
+                 holes=None):
+        # holes : HoleQueue optionnelle qui fournit les trous suivants
+        self.holes = holes
+        self.width = width
+        self.height = height
+        self.players = [Player(x=width // nx, y=height // ny, radius=player_radius),
+                        Player(x=width * (nx-1) // nx, y=height * (ny-1) // ny, radius=player_radius)]
+        self.swarm = BallSwarm()
+        self.who_plays = 0
+        self.hole = -1
+        self.new_hole(seed)
+
+    def new_hole(self, seed=None):
+        # Nouveau terrain, les balles en vol sont perdues
+        if seed is None and self.holes is not None:
+            self.terrain = self.holes.get()
+        else:
+            self.terrain = Hole(self.width, self.height, seed)
+        self.altitude_matrix, self.slope_field = self.terrain.resample(self.width, self.height)
+        self.swarm.clear()
+        self.vinitmax = vinitmax
+        self.n_test = 0
+        self.hole += 1
+
+    def resize(self, width, height):
+        # La taille sert de limite aux balles, le terrain est rééchantillonné à cette taille
+        if (width, height) == (self.width, self.height):
+            return
+        self.width = width
+        self.height = height
+        self.altitude_matrix, self.slope_field = self.terrain.resample(width, height)
+        if self.holes is not None:
+            self.holes.resize(width, height)
+
+    def shot_velocities(self, target):
+        # Vitesses des tirs vers target : une gerbe de 3x3 balles autour du clic,
+        # décalées de -1, 0 ou 1 pixel sur chaque axe (x varie le moins vite)
+        shooter = self.players[self.who_plays]
+        spread = np.array([-1.0, 0.0, 1.0])
+        vx, vy = np.meshgrid(target[0]-shooter.x + spread, target[1]-shooter.y + spread, indexing="ij")
+        return vx.ravel() / vdiv, vy.ravel() / vdiv
+
+    def shoot(self, target):
+        # Tirer vers target (position du clic), seulement si aucune balle n'est en vol
+        if len(self.swarm) > 0:
+            return False
+        self.vinitmax = self.vinitmax*1.05
+        shooter = self.players[self.who_plays]
+        vx, vy = self.shot_velocities(target)
+        x, y = shooter.launch_position(vx, vy)
+        self.swarm.add(x, y, vx, vy, owner=self.who_plays, click_pos=target, vmax=self.vinitmax)
+        self.who_plays = (self.who_plays+1)%2
+        self.n_test += 1
+        return True
+
+    def step(self):
+        # Un pas de simulation
+        # Renvoie les indices des balles arrêtées à ce pas, et le joueur qui a marqué (ou None)
+        # Quand un joueur marque, les balles sont perdues avec l'ancien trou : aucune n'est renvoyée
+        idx, finished = self.swarm.step(self.slope_field, self.width, self.height)
+        collision_player_0 = self.swarm.check_collision(idx, self.players[0])
+        collision_player_1 = self.swarm.check_collision(idx, self.players[1])
+        scorer = None
+        if collision_player_0:
+            self.players[1].score += 1
+            self.who_plays = 0
+            scorer = 1
+        if collision_player_1:
+            self.players[0].score += 1
+            self.who_plays = 1
+            scorer = 0
+        if scorer is not None:
+            self.new_hole()
+            finished = finished[:0]
+        return finished, scorer
+
+    def run_until_settled(self, max_steps=None):
+        # Simuler jusqu'à l'arrêt de toutes les balles (ou jusqu'à un point marqué)
+        # Renvoie (nombre de pas, joueur qui a marqué ou None)
+        n_steps = 0
+        while len(self.swarm) > 0 and (max_steps is None or n_steps < max_steps):
+            _, scorer = self.step()
+            n_steps += 1
+            if scorer is not None:
+                return n_steps, scorer
+        return n_steps, None
@@ -0,0 +1,127 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from golf_simulation import BallSwarm, GolfSimulation, dist, vdiv
+
+# Recherche de tirs : on simule des lots de vitesses initiales (vx, vy) et on garde
+# celles dont la balle passe le plus près du trou visé, de la grille grossière à la fine
+
+def simulate_shots(slope_field, shooter, target, vx, vy, vmax, width=None, height=None,
+                   avoid=None, max_moves=1000):
+    # Simuler tous les tirs ensemble, renvoie pour chaque tir la distance minimale
+    # entre la balle et le centre de target (np.inf si la balle touche avoid)
+    # Les balles sorties de l'écran ou bloquées sont arrêtées par BallSwarm.step,
+    # celles qui touchent target ou avoid sont arrêtées tout de suite
+    if height is None:
+        height, width = slope_field.shape[:2]
+    vx = np.asarray(vx, dtype=float)
+    vy = np.asarray(vy, dtype=float)
+    swarm = BallSwarm(capacity=max(1, vx.size), max_moves=max_moves)
+    x, y = shooter.launch_position(vx, vy)
+    swarm.add(x, y, vx, vy, vmax=vmax)
+    closest = np.full(vx.size, np.inf)
+    lost = np.zeros(vx.size, dtype=bool)
+    while len(swarm) > 0:
+        idx, _ = swarm.step(slope_field, width, height)
+        d = dist(swarm.x[idx], swarm.y[idx], target.x, target.y)
+        closest[idx] = np.minimum(closest[idx], d)
+        stop = d < target.radius
+        if avoid is not None:
+            own_goal = avoid.check_collision(swarm.x[idx], swarm.y[idx]) & ~stop
+            lost[idx[own_goal]] = True
+            stop |= own_goal
+        swarm.alive[idx[stop]] = False
+    closest[lost] = np.inf
+    return closest
+
+def _simulate_chunk(shm_name, shape, dtype, vx, vy, kwargs):
+    # Tâche d'un processus : les pentes sont lues dans la mémoire partagée
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        slope_field = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        closest = simulate_shots(slope_field, vx=vx, vy=vy, **kwargs)
+        del slope_field
+    finally:
+        shm.close()
+    return closest
+
+def disc_grid(center_x, center_y, spacing, n, vmax):
+    # Grille n x n de vitesses autour de (center_x, center_y), ramenée dans le disque
+    # de rayon vmax (au-delà, la vitesse serait de toute façon limitée à vmax)
+    offsets = (np.arange(n) - (n - 1) / 2) * spacing
+    vx, vy = np.meshgrid(center_x + offsets, center_y + offsets)
+    vx, vy = vx.ravel(), vy.ravel()
+    v = np.hypot(vx, vy)
+    shrink = np.where(v > vmax, vmax / np.maximum(v, 1e-300), 1.0)
+    return vx * shrink, vy * shrink
+
+def solve_shot(slope_field, shooter, target, vmax, width=None, height=None, avoid=None,
+               grid=24, levels=3, keep=8, refine=5, workers=1, chunk=1024, max_moves=1000):
+    # Chercher les meilleurs tirs de shooter vers target
+    # Niveau 0 : grille grid x grid sur le disque des vitesses possibles
+    # Niveaux suivants : grille refine x refine autour des keep meilleurs tirs,
+    # avec un pas divisé par (refine - 1) / 2
+    # workers > 1 répartit les lots de chunk tirs sur un ProcessPoolExecutor
+    # Renvoie un tableau (n, 3) de (vx, vy, distance minimale au trou), trié par distance
+    kwargs = dict(shooter=shooter, target=target, vmax=vmax, width=width, height=height,
+                  avoid=avoid, max_moves=max_moves)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    shm = None
+    executor = None
+    if workers > 1:
+        slope_field = np.ascontiguousarray(slope_field)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, slope_field.nbytes))
+        np.ndarray(slope_field.shape, dtype=slope_field.dtype, buffer=shm.buf)[...] = slope_field
+        executor = ProcessPoolExecutor(max_workers=workers)
+
+    def evaluate(vx, vy):
+        if executor is None:
+            return simulate_shots(slope_field, vx=vx, vy=vy, **kwargs)
+        futures = [executor.submit(_simulate_chunk, shm.name, slope_field.shape, slope_field.dtype,
+                                   vx[start:start + chunk], vy[start:start + chunk], kwargs)
+                   for start in range(0, vx.size, chunk)]
+        return np.concatenate([future.result() for future in futures])
+
+    try:
+        spacing = 2 * vmax / grid
+        vx, vy = disc_grid(0.0, 0.0, spacing, grid, vmax)
+        shots = np.stack((vx, vy, evaluate(vx, vy)), axis=-1)
+        for _ in range(1, levels):
+            best = shots[np.argsort(shots[:, 2], kind="stable")[:keep]]
+            spacing = spacing * 2 / (refine - 1)
+            candidates = [disc_grid(bx, by, spacing, refine, vmax) for bx, by, _ in best]
+            vx = np.concatenate([c[0] for c in candidates])
+            vy = np.concatenate([c[1] for c in candidates])
+            shots = np.concatenate((shots, np.stack((vx, vy, evaluate(vx, vy)), axis=-1)))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+            shm.close()
+            shm.unlink()
+    return shots[np.argsort(shots[:, 2], kind="stable")]
+
+def find_shot(simulation, **kwargs):
+    # Meilleur tir du joueur dont c'est le tour dans une GolfSimulation
+    # Renvoie (position de clic équivalente, distance minimale au trou adverse)
+    shooter = simulation.players[simulation.who_plays]
+    target = simulation.players[1 - simulation.who_plays]
+    # Le prochain tir aura une vitesse maximale augmentée de 5% (voir GolfSimulation.shoot)
+    shots = solve_shot(simulation.slope_field, shooter, target, simulation.vinitmax*1.05,
+                       width=simulation.width, height=simulation.height, avoid=shooter, **kwargs)
+    vx, vy, closest = shots[0]
+    return (float(shooter.x + vx*vdiv), float(shooter.y + vy*vdiv)), float(closest)
+
+if __name__ == "__main__":
+    simulation = GolfSimulation(seed=0)
+    start = time.perf_counter()
+    shooter, target = simulation.players
+    shots = solve_shot(simulation.slope_field, shooter, target, simulation.vinitmax*1.05,
+                       avoid=shooter, workers=os.cpu_count())
+    elapsed = time.perf_counter() - start
+    radius = target.radius
+    print(f"{len(shots)} tirs simulés en {elapsed:.2f} s ({len(shots) / elapsed:.0f} tirs/s)")
+    print(f"{np.count_nonzero(shots[:, 2] < radius)} tirs dans le trou, meilleur : "
+          f"v = ({shots[0, 0]:.3f}, {shots[0, 1]:.3f}), distance {shots[0, 2]:.1f}")
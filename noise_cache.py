@@ -0,0 +1,155 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from perlin_noise import NOISE_BACKENDS, perlin_noise
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache",
+                                 "various_games", "noise")
+
+class NoiseCache:
+    """
+    Two-level cache of noise maps.
+    An in-process LRU dictionary sits in front of a size-capped directory of
+    .npy files, which are opened as read-only memory maps and evicted in
+    least recently used order (file modification time, refreshed on hit).
+    Cached arrays are shared between callers and must not be modified.
+    The cache can be used from several threads.
+    :param directory: Directory of the .npy files
+    :param max_bytes: Maximum total size of the directory
+    :param memory_items: Maximum number of arrays kept in the process
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=256 * 2**20,
+                 memory_items=8):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(params):
+        """
+        Stable file name for a dictionary of parameters.
+        :param params: Parameters the cached array depends on
+        :return: Hexadecimal digest
+        """
+        text = repr(sorted(params.items()))
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def get(self, params, compute):
+        """
+        Return the array cached for params, computing and storing it on a miss.
+        :param params: Parameters the array depends on
+        :param compute: Function without argument building the array
+        :return: Read-only numpy array
+        """
+        key = self.key(params)
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+        path = self.path(key)
+        try:
+            array = np.asarray(np.load(path, mmap_mode="r"))
+            os.utime(path)
+        except (OSError, ValueError):
+            array = np.array(compute())
+            array.flags.writeable = False
+            self.store(path, array)
+        self.remember(key, array)
+        return array
+
+    def store(self, path, array):
+        # Write to a temporary file first so that readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            np.save(file, array)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def remember(self, key, array):
+        with self.lock:
+            self.memory[key] = array
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_items:
+                self.memory.popitem(last=False)
+
+    def evict(self):
+        """
+        Delete the least recently used files until the directory fits in
+        max_bytes.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".npy"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+        for name in os.listdir(self.directory):
+            if name.endswith(".npy"):
+                os.remove(os.path.join(self.directory, name))
+
+_default_cache = None
+
+def default_cache():
+    """
+    :return: NoiseCache shared by the process, in DEFAULT_CACHE_DIR
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = NoiseCache()
+    return _default_cache
+
+def cached_perlin_noise(width, height, scale=100, seed=None, octaves=6,
+                        persistence=0.5, lacunarity=2.0, backend="random",
+                        cache=None):
+    """
+    perlin_noise through a NoiseCache.
+    :param width: Width of the noise array
+    :param height: Height of the noise array
+    :param scale: Scale of the noise pattern
+    :param seed: Seed of the gradient lattice (drawn from np.random if None)
+    :param octaves: Number of octaves summed
+    :param persistence: Amplitude ratio between two octaves
+    :param lacunarity: Frequency ratio between two octaves
+    :param backend: Name of the noise backend, see perlin_noise.NOISE_BACKENDS
+    :param cache: NoiseCache to use (default_cache() if None)
+    :return: Read-only 2D numpy array of Perlin noise
+    """
+    if backend not in NOISE_BACKENDS:
+        raise ValueError(f"Unknown noise backend: {backend}")
+    if seed is None:
+        seed = np.random.randint(2**31)
+    if cache is None:
+        cache = default_cache()
+    params = dict(seed=seed, width=width, height=height, scale=scale,
+                  octaves=octaves, persistence=persistence,
+                  lacunarity=lacunarity, backend=backend)
+    return cache.get(params, lambda: perlin_noise(width, height, scale=scale,
+                                                  seed=seed, octaves=octaves,
+                                                  persistence=persistence,
+                                                  lacunarity=lacunarity,
+                                                  backend=backend))
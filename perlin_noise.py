@@ -1,38 +1,1063 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 import numpy as np
-import matplotlib.pyplot as plt
 
-def perlin_noise(width, height, scale=100):
+LATTICE_SIZE = 256
+AXIS_GRADIENTS = np.array([[0, 1], [0, -1], [1, 0], [-1, 0]], dtype=float)
+# Skewing factors of the 2D and 3D simplex grids
+F2 = 0.5 * (np.sqrt(3) - 1)
+G2 = (3 - np.sqrt(3)) / 6
+F3 = 1 / 3
+G3 = 1 / 6
+# Per-octave amplitude bounds of simplex noise, see SimplexField.fbm_bound
+SIMPLEX_BOUNDS = {2: 0.71, 3: 0.8}
+
+# Noise field classes by name, see register_backend
+NOISE_BACKENDS = {}
+
+def register_backend(name):
+    """
+    Class decorator adding a noise field to NOISE_BACKENDS.
+    A backend is a NoiseField subclass built from a seed.
+    :param name: Name used to select the backend
+    :return: Decorator
+    """
+    def decorator(cls):
+        cls.backend = name
+        NOISE_BACKENDS[name] = cls
+        return cls
+    return decorator
+
+def make_field(seed=None, backend="random"):
+    """
+    Build a noise field from the backend registry.
+    :param seed: Seed of the field (None draws one from np.random)
+    :param backend: Name of the backend in NOISE_BACKENDS
+    :return: Noise field
+    """
+    try:
+        cls = NOISE_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown noise backend: {backend}") from None
+    return cls(seed)
+
+class NoiseField:
+    """
+    Base class of the noise backends. A subclass is built from a seed and
+    implements fbm(x, y, ...) with the arguments of perlin_fbm plus an
+    optional time coordinate t, and fbm_bound(octaves, persistence).
+    """
+    backend = None
+
+    def sample(self, x, y, scale=1, octaves=6, persistence=0.5,
+               lacunarity=2.0, bounds=None, derivatives=False,
+               dtype=np.float64, t=None):
+        """
+        Evaluate the fBm of this field at arbitrary float coordinates, in the
+        units of perlin_noise (the map spans [0, 1) on both axes). x and y
+        are broadcast together: a row and a column give a full grid, two
+        arrays give scattered points and two floats a single position.
+        :param x: X coordinates
+        :param y: Y coordinates
+        :param scale: Frequency of the first octave
+        :param octaves: Number of octaves summed
+        :param persistence: Amplitude ratio between two octaves
+        :param lacunarity: Frequency ratio between two octaves
+        :param bounds: (low, high) raw values mapped to 0 and 1 (raw fBm if None)
+        :param derivatives: Also return the partial derivatives along x and y
+        :param dtype: Floating type of the result
+        :param t: Time (third) coordinates, for the backends supporting them
+        :return: Noise values, or (values, d/dx, d/dy) if derivatives is True
+        """
+        result = self.fbm(x, y, scale=scale, octaves=octaves,
+                          persistence=persistence, lacunarity=lacunarity,
+                          dtype=dtype, derivatives=derivatives, t=t)
+        if bounds is None:
+            return result
+        low, high = bounds
+        if not derivatives:
+            result -= low
+            result /= high - low
+            return result
+        noise, d_dx, d_dy = result
+        noise -= low
+        noise /= high - low
+        d_dx /= high - low
+        d_dy /= high - low
+        return noise, d_dx, d_dy
+
+@register_backend("random")
+class PerlinField(NoiseField):
+    """
+    Seeded gradient lattice shared by every octave of a Perlin noise field.
+    The gradients and the permutation table are drawn once, so evaluating
+    the same field twice gives the same noise.
+    :param seed: Seed of the lattice (None draws one from np.random)
+    """
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = np.random.randint(2**31)
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.gradients = self.draw_gradients(rng)
+        perm = rng.permutation(LATTICE_SIZE)
+        # Doubled so that perm[perm[x] + y] never needs a second modulo
+        self.perm = np.concatenate((perm, perm))
+
+    def draw_gradients(self, rng):
+        """
+        :param rng: numpy Generator of the field
+        :return: (LATTICE_SIZE, 2) array of gradients, random normal vectors
+        """
+        return rng.standard_normal((LATTICE_SIZE, 2))
+
+    def lattice_hash(self, x, y):
+        """
+        Hash integer lattice coordinates into the gradient table.
+        :param x: Integer X coordinates
+        :param y: Integer Y coordinates
+        :return: Indices into self.gradients
+        """
+        return self.perm[self.perm[x % LATTICE_SIZE] + y % LATTICE_SIZE]
+
+    def fbm_bound(self, octaves=6, persistence=0.5):
+        """
+        Analytic bound on the absolute value of perlin_fbm for this lattice.
+        A corner contributes at most |g| * |d| and the interpolated distances
+        never exceed sqrt(2)/2, so each octave is bounded by that times the
+        largest gradient norm.
+        :param octaves: Number of octaves summed
+        :param persistence: Amplitude ratio between two octaves
+        :return: Bound b such that -b <= perlin_fbm(...) <= b
+        """
+        gmax = np.max(np.linalg.norm(self.gradients, axis=1))
+        amp = sum(persistence ** i for i in range(octaves))
+        return np.sqrt(0.5) * gmax * amp
+
+    def fbm(self, x, y, scale=1, octaves=6, persistence=0.5, lacunarity=2.0,
+            dtype=np.float64, out=None, derivatives=False, t=None):
+        """
+        Raw fBm of this field, see perlin_fbm.
+        """
+        if t is not None:
+            raise ValueError(f"The {self.backend} backend has no time axis")
+        return perlin_fbm(x, y, self, scale=scale, octaves=octaves,
+                          persistence=persistence, lacunarity=lacunarity,
+                          dtype=dtype, out=out, derivatives=derivatives)
+
+    def __call__(self, x, y):
+        return perlin_noise_2d(x, y, field=self)
+
+@register_backend("axis")
+class AxisPerlinField(PerlinField):
+    """
+    Perlin lattice whose gradients are the four axis directions, the
+    variant that test.py used to implement on its own.
+    :param seed: Seed of the lattice (None draws one from np.random)
+    """
+    def draw_gradients(self, rng):
+        return AXIS_GRADIENTS[np.arange(LATTICE_SIZE) % len(AXIS_GRADIENTS)]
+
+@register_backend("simplex")
+class SimplexField(NoiseField):
+    """
+    Seeded simplex noise, in 2D (x, y) or 3D (x, y, t). A sample blends 3
+    corners in 2D and 4 in 3D, instead of 4 and 8 for Perlin noise, so
+    animated or volumetric terrain is cheaper than stacking 2D slices.
+    :param seed: Seed of the lattice (None draws one from np.random)
+    """
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = np.random.randint(2**31)
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        angles = rng.uniform(0, 2 * np.pi, LATTICE_SIZE)
+        self.gradients = np.stack((np.cos(angles), np.sin(angles)), axis=-1)
+        gradients_3d = rng.standard_normal((LATTICE_SIZE, 3))
+        self.gradients_3d = gradients_3d / np.linalg.norm(gradients_3d, axis=1,
+                                                          keepdims=True)
+        perm = rng.permutation(LATTICE_SIZE)
+        self.perm = np.concatenate((perm, perm))
+        # Gradients composed with the outer permutation, one contiguous row
+        # per component, so that a corner needs a single gather per component
+        self.composed_gradients = np.ascontiguousarray(self.gradients[self.perm].T)
+        self.composed_gradients_3d = np.ascontiguousarray(
+            self.gradients_3d[self.perm].T)
+
+    def fbm(self, x, y, scale=1, octaves=6, persistence=0.5, lacunarity=2.0,
+            dtype=np.float64, out=None, derivatives=False, t=None):
+        """
+        Raw fBm of this field, see simplex_fbm.
+        """
+        return simplex_fbm(x, y, self, t=t, scale=scale, octaves=octaves,
+                           persistence=persistence, lacunarity=lacunarity,
+                           dtype=dtype, out=out, derivatives=derivatives)
+
+    def fbm_bound(self, octaves=6, persistence=0.5, dimension=2):
+        """
+        Bound on the absolute value of simplex_fbm. With unit gradients, the
+        sum of the corner kernels times the distances never exceeds
+        SIMPLEX_BOUNDS[dimension] (measured on a fine grid, rounded up).
+        :param octaves: Number of octaves summed
+        :param persistence: Amplitude ratio between two octaves
+        :param dimension: 2, or 3 when sampling with a time coordinate
+        :return: Bound b such that -b <= simplex_fbm(...) <= b
+        """
+        amp = sum(persistence ** i for i in range(octaves))
+        return SIMPLEX_BOUNDS[dimension] * amp
+
+def perlin_noise(width, height, scale=100, seed=None, field=None,
+                 octaves=6, persistence=0.5, lacunarity=2.0,
+                 dtype=np.float64, fused=True, derivatives=False,
+                 backend="random", t=None):
     """
     Generate 2D Perlin noise using numpy.
     :param width: Width of the noise array
     :param height: Height of the noise array
     :param scale: Scale of the noise pattern
-    :return: 2D numpy array of Perlin noise
+    :param seed: Seed of the gradient lattice (ignored if field is given)
+    :param field: Noise field to sample, shared by all octaves
+    :param octaves: Number of octaves summed
+    :param persistence: Amplitude ratio between two octaves
+    :param lacunarity: Frequency ratio between two octaves
+    :param dtype: Floating type of the result (np.float32 halves the memory)
+    :param fused: Use the buffered perlin_fbm kernel instead of one
+                  perlin_noise_2d call per octave
+    :param derivatives: Also return the exact slope of the normalized noise,
+                        per column and per row (fused kernel only)
+    :param backend: Noise backend of the field (ignored if field is given)
+    :param t: Time coordinate of the map, for 3D backends such as "simplex"
+    :return: 2D numpy array of Perlin noise, or (noise, d/dcolumn, d/drow)
+             if derivatives is True
     """
+    if field is None:
+        field = make_field(seed, backend)
+    if not fused and (derivatives or t is not None
+                      or not isinstance(field, PerlinField)):
+        raise ValueError("Only 2D Perlin values can skip the fused kernel")
     # Generate grid coordinates
     x = np.linspace(0, 1, width, endpoint=False)
     y = np.linspace(0, 1, height, endpoint=False)
-    X, Y = np.meshgrid(x, y)
-    # Generate noise using Perlin algorithm
-    noise = np.zeros((height, width))
-    octaves = 6
-    persistence = 0.5
-    lacunarity = 2.0
+    if derivatives:
+        noise, d_dx, d_dy = field.fbm(x[np.newaxis, :], y[:, np.newaxis],
+                                      scale=scale, octaves=octaves,
+                                      persistence=persistence,
+                                      lacunarity=lacunarity, dtype=dtype,
+                                      derivatives=True, t=t)
+        noise -= np.min(noise)
+        amplitude = np.max(noise)
+        noise /= amplitude
+        # Coordinates advance by 1/width per column and 1/height per row
+        d_dx /= amplitude * width
+        d_dy /= amplitude * height
+        return noise, d_dx, d_dy
+    if fused:
+        # The grid is separable: only the lattice lookups need the full 2D shape
+        noise = field.fbm(x[np.newaxis, :], y[:, np.newaxis],
+                          scale=scale, octaves=octaves,
+                          persistence=persistence, lacunarity=lacunarity,
+                          dtype=dtype, t=t)
+    else:
+        X, Y = np.meshgrid(x, y)
+        # Generate noise using Perlin algorithm
+        noise = np.zeros((height, width))
+        for i in range(octaves):
+            freq = scale * (lacunarity ** i)
+            amp = persistence ** i
+            noise += amp * perlin_noise_2d(X * freq, Y * freq, field=field)
+        noise = noise.astype(dtype, copy=False)
+    # Normalize the noise to [0, 1]
+    noise -= np.min(noise)
+    noise /= np.max(noise)
+    return noise
+
+def perlin_noise_batch(width, height, scales, weights=None, seed=None,
+                       field=None, octaves=6, persistence=0.5, lacunarity=2.0,
+                       dtype=np.float64, backend="random"):
+    """
+    Generate several noise maps of different scales from one field.
+    The grid is set up once and every octave frequency is evaluated once:
+    maps whose scales differ by a power of the lacunarity (e.g. 3 and 12)
+    share most of their octaves. The maps are identical to separate
+    perlin_noise calls with the same field.
+    :param width: Width of the noise arrays
+    :param height: Height of the noise arrays
+    :param scales: Scales of the N maps
+    :param weights: Optional N weights: the weighted sum of the maps is
+                    returned instead of the maps themselves
+    :param seed: Seed of the field (ignored if field is given)
+    :param field: Noise field shared by all the maps
+    :param octaves: Number of octaves summed
+    :param persistence: Amplitude ratio between two octaves
+    :param lacunarity: Frequency ratio between two octaves
+    :param dtype: Floating type of the result
+    :param backend: Noise backend of the field (ignored if field is given)
+    :return: (N, height, width) array of maps each normalized to [0, 1], or
+             their (height, width) weighted sum if weights are given
+    """
+    if field is None:
+        field = make_field(seed, backend)
+    scales = np.asarray(scales, dtype=np.float64).ravel()
+    # Maps and amplitudes using each octave frequency
+    users = {}
+    for k, scale in enumerate(scales):
+        for i in range(octaves):
+            users.setdefault(scale * (lacunarity ** i), []).append((k, persistence ** i))
+    x = np.linspace(0, 1, width, endpoint=False)
+    y = np.linspace(0, 1, height, endpoint=False)
+    noise = np.zeros((len(scales), height, width), dtype=dtype)
+    octave = np.empty((height, width), dtype=dtype)
+    # Increasing frequencies add the octaves of every map in perlin_fbm's order
+    for freq in sorted(users):
+        field.fbm(x[np.newaxis, :], y[:, np.newaxis], scale=freq, octaves=1,
+                  dtype=dtype, out=octave)
+        for k, amp in users[freq]:
+            noise[k] += amp * octave
+    # Normalize every map to [0, 1]
+    noise -= np.min(noise, axis=(1, 2), keepdims=True)
+    noise /= np.max(noise, axis=(1, 2), keepdims=True)
+    if weights is None:
+        return noise
+    return np.tensordot(np.asarray(weights, dtype=dtype), noise, axes=1)
+
+def perlin_fbm(x, y, field, scale=1, octaves=6, persistence=0.5,
+               lacunarity=2.0, dtype=np.float64, out=None, derivatives=False):
+    """
+    Sum octaves of Perlin noise (fractional Brownian motion) without
+    normalizing. x and y are broadcast together, so a grid can be given as
+    a row and a column: the fractional parts and interpolation weights then
+    stay 1D, and the 2D work buffers are allocated once for all octaves.
+    :param x: X coordinates
+    :param y: Y coordinates
+    :param field: PerlinField giving the gradient lattice
+    :param scale: Frequency of the first octave (an array broadcast with x
+                  and y gives one map per scale)
+    :param octaves: Number of octaves summed
+    :param persistence: Amplitude ratio between two octaves
+    :param lacunarity: Frequency ratio between two octaves
+    :param dtype: Floating type of the work buffers and of the result
+    :param out: Array receiving the result (allocated if None)
+    :param derivatives: Also return the analytic partial derivatives
+    :return: Numpy array of raw fBm values, or (values, d/dx, d/dy) if
+             derivatives is True
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    shape = np.broadcast_shapes(x.shape, y.shape, np.shape(scale))
+    if out is None:
+        out = np.zeros(shape, dtype=dtype)
+    else:
+        out[...] = 0
+    perm = field.perm
+    # Gradients already composed with the outer permutation: one gather each
+    gx = field.gradients[perm, 0].astype(dtype)
+    gy = field.gradients[perm, 1].astype(dtype)
+    # Work buffers, reused by every octave
+    index = np.empty(shape, dtype=np.intp)
+    nx0 = np.empty(shape, dtype=dtype)
+    nx1 = np.empty(shape, dtype=dtype)
+    n = np.empty(shape, dtype=dtype)
+    tmp = np.empty(shape, dtype=dtype)
+    if derivatives:
+        d_dx = np.zeros(shape, dtype=dtype)
+        d_dy = np.zeros(shape, dtype=dtype)
+        # Gradients of the two corners of an edge, and derivatives of the edges
+        gxa, gya, gxb, gyb, dtx0, dty0, dtx1, dty1 = (
+            np.empty(shape, dtype=dtype) for _ in range(8))
+    else:
+        gxa = gya = gxb = gyb = dtx0 = dty0 = dtx1 = dty1 = None
+
+    def corner(px, yi, dx, dy, res, gxr=None, gyr=None):
+        # res = gradient(px, yi) . (dx, dy), without stacking displacements.
+        # The gradient components are left in gxr and gyr when given.
+        if gxr is None:
+            gxr, gyr = res, tmp
+        # Indices are always in range: mode="wrap" skips the bounds check
+        # and the buffering of out
+        np.add(px, yi, out=index)
+        np.take(gx, index, out=gxr, mode="wrap")
+        np.multiply(gxr, dx, out=res)
+        np.take(gy, index, out=gyr, mode="wrap")
+        np.multiply(gyr, dy, out=tmp)
+        res += tmp
+
+    def edge(px0, px1, yi, tx, dy, wx, dwx, res, dtx, dty):
+        # Interpolate the corners (x0, yi) and (x0 + 1, yi) along x
+        corner(px0, yi, tx, dy, res, gxa, gya)
+        corner(px1, yi, tx - 1, dy, n, gxb, gyb)
+        if derivatives:
+            np.subtract(n, res, out=dtx)
+            dtx *= dwx
+            np.multiply(gxa, 1 - wx, out=gxa)
+            np.multiply(gxb, wx, out=gxb)
+            dtx += gxa
+            dtx += gxb
+            np.multiply(gya, 1 - wx, out=dty)
+            np.multiply(gyb, wx, out=gyb)
+            dty += gyb
+        res *= 1 - wx
+        np.multiply(n, wx, out=n)
+        res += n
+
     for i in range(octaves):
         freq = scale * (lacunarity ** i)
         amp = persistence ** i
-        noise += amp * perlin_noise_2d(X * freq, Y * freq)
+        xf = x * freq
+        yf = y * freq
+        x0 = np.floor(xf)
+        y0 = np.floor(yf)
+        tx = xf - x0
+        ty = yf - y0
+        wx = cubic(smoothstep(tx)).astype(dtype, copy=False)
+        wy = cubic(smoothstep(ty)).astype(dtype, copy=False)
+        if derivatives:
+            dwx = fade_derivative(tx).astype(dtype, copy=False)
+            dwy = fade_derivative(ty).astype(dtype, copy=False)
+        else:
+            dwx = dwy = None
+        tx = tx.astype(dtype, copy=False)
+        ty = ty.astype(dtype, copy=False)
+        x0 = x0.astype(np.intp) % LATTICE_SIZE
+        y0 = y0.astype(np.intp) % LATTICE_SIZE
+        # perm is doubled, so x0 + 1 and perm[.] + y0 + 1 stay in range
+        px0 = perm[x0]
+        px1 = perm[x0 + 1]
+        # Bottom edge
+        edge(px0, px1, y0, tx, ty, wx, dwx, nx0, dtx0, dty0)
+        # Top edge
+        edge(px0, px1, y0 + 1, tx, ty - 1, wx, dwx, nx1, dtx1, dty1)
+        if derivatives:
+            # Chain rule: d/dx = freq * d/dtx
+            dtx0 *= 1 - wy
+            dtx1 *= wy
+            dtx0 += dtx1
+            dtx0 *= amp * freq
+            d_dx += dtx0
+            np.subtract(nx1, nx0, out=n)
+            n *= dwy
+            dty0 *= 1 - wy
+            dty1 *= wy
+            dty0 += dty1
+            dty0 += n
+            dty0 *= amp * freq
+            d_dy += dty0
+        # Blend the edges and accumulate the octave
+        nx0 *= 1 - wy
+        nx1 *= wy
+        nx0 += nx1
+        nx0 *= amp
+        out += nx0
+    if derivatives:
+        return out, d_dx, d_dy
+    return out
+
+def simplex_fbm(x, y, field, t=None, scale=1, octaves=6, persistence=0.5,
+                lacunarity=2.0, dtype=np.float64, out=None, derivatives=False):
+    """
+    Sum octaves of simplex noise without normalizing. x, y (and t) are
+    broadcast together; t is scaled by the octave frequency like x and y,
+    so finer octaves also evolve faster.
+    :param x: X coordinates
+    :param y: Y coordinates
+    :param field: SimplexField giving the gradients
+    :param t: Time coordinates (2D noise if None)
+    :param scale: Frequency of the first octave
+    :param octaves: Number of octaves summed
+    :param persistence: Amplitude ratio between two octaves
+    :param lacunarity: Frequency ratio between two octaves
+    :param dtype: Floating type of the coordinates, of the work buffers and
+                  of the result
+    :param out: Array receiving the result (allocated if None)
+    :param derivatives: Also return the analytic partial derivatives along
+                        x and y
+    :return: Numpy array of raw fBm values, or (values, d/dx, d/dy) if
+             derivatives is True
+    """
+    x = np.asarray(x, dtype=dtype)
+    y = np.asarray(y, dtype=dtype)
+    if t is None:
+        shape = np.broadcast_shapes(x.shape, y.shape, np.shape(scale))
+    else:
+        t = np.asarray(t, dtype=dtype)
+        shape = np.broadcast_shapes(x.shape, y.shape, t.shape,
+                                    np.shape(scale))
+    if out is None:
+        out = np.zeros(shape, dtype=dtype)
+    else:
+        out[...] = 0
+    if derivatives:
+        d_dx = np.zeros(shape, dtype=dtype)
+        d_dy = np.zeros(shape, dtype=dtype)
+    # Work buffers, reused by every octave
+    work = SimplexBuffers(shape, 2 if t is None else 3, derivatives, dtype)
+    for i in range(octaves):
+        freq = np.asarray(scale * (lacunarity ** i), dtype=dtype)
+        amp = persistence ** i
+        if t is None:
+            value, dx, dy = simplex_2d(x * freq, y * freq, field, derivatives,
+                                       work)
+        else:
+            value, dx, dy = simplex_3d(x * freq, y * freq, t * freq, field,
+                                       derivatives, work)
+        value *= amp
+        out += value
+        if derivatives:
+            dx *= amp * freq
+            d_dx += dx
+            dy *= amp * freq
+            d_dy += dy
+    if derivatives:
+        return out, d_dx, d_dy
+    return out
+
+class SimplexBuffers:
+    """
+    Work buffers of simplex_2d and simplex_3d, so that the octaves of
+    simplex_fbm do not allocate their temporaries again.
+    Unlike the Perlin lattice, the skewed grid mixes x and y from the first
+    operation, so a row and a column cannot stay 1D: every buffer has the
+    full broadcast shape. Per sample, 2D noise holds 8 floats of dtype and
+    4 intp (13 floats with derivatives), 3D noise 10 floats and 5 intp
+    (16 floats with derivatives), plus a few bytes of flags.
+    :param shape: Shape of the coordinates once broadcast together
+    :param dimension: 2, or 3 for simplex_3d
+    :param derivatives: Also allocate the buffers of the derivatives
+    :param dtype: Floating type of the buffers
+    """
+    def __init__(self, shape, dimension=2, derivatives=False,
+                 dtype=np.float64):
+        # The corner displacements cx, cy (and cz) first hold the cell floors
+        floats = ["x0", "y0", "cx", "cy", "r", "dot", "tmp", "value"]
+        # Cell indices in the lattice, and hashes of the corners
+        indices = ["ci", "cj", "h", "h2"]
+        # Offsets of the middle corners
+        flags = ["i1", "j1"]
+        gradients = ["cgx", "cgy"]
+        if dimension == 3:
+            floats += ["z0", "cz"]
+            indices += ["ck"]
+            flags += ["k1", "i2", "j2", "k2", "x_ge_y", "x_ge_z", "y_ge_z",
+                      "y_gt_x"]
+            gradients += ["cgz"]
+        if derivatives:
+            # The corner gradients are needed again for the derivatives
+            floats += gradients + ["dx", "dy", "q"]
+        for names, buffer_type in ((floats, dtype), (indices, np.intp),
+                                   (flags, bool)):
+            for name in names:
+                setattr(self, name, np.empty(shape, dtype=buffer_type))
+        if not derivatives:
+            for name in gradients:
+                setattr(self, name, self.tmp)
+
+def simplex_2d(x, y, field, derivatives=False, work=None):
+    """
+    One octave of 2D simplex noise.
+    :param x: X coordinates
+    :param y: Y coordinates
+    :param field: SimplexField giving the gradients
+    :param derivatives: Also compute the partial derivatives
+    :param work: SimplexBuffers of the broadcast shape (allocated in float64
+                 if None)
+    :return: (values, d/dx, d/dy), the derivatives being None if not asked.
+             The arrays belong to work and are overwritten by its next use
+    """
+    if work is None:
+        work = SimplexBuffers(np.broadcast_shapes(np.shape(x), np.shape(y)),
+                              2, derivatives)
+    w = work
+    perm = field.perm
+    gx, gy = field.composed_gradients.astype(w.tmp.dtype, copy=False)
+    tmp = w.tmp
+    # Skew to find the simplex cell, then unskew the cell origin
+    s = np.add(x, y, out=w.x0)
+    s *= F2
+    i = np.add(x, s, out=w.cx)
+    np.floor(i, out=i)
+    j = np.add(y, s, out=w.cy)
+    np.floor(j, out=j)
+    t = np.add(i, j, out=tmp)
+    t *= G2
+    x0 = np.subtract(x, i, out=w.x0)
+    x0 += t
+    y0 = np.subtract(y, j, out=w.y0)
+    y0 += t
+    # Middle corner: one step along the larger coordinate
+    i1 = np.greater(x0, y0, out=w.i1)
+    j1 = np.logical_not(i1, out=w.j1)
+    # i and j are already floored, so the cast is exact
+    ci = w.ci
+    np.copyto(ci, i, casting="unsafe")
+    ci %= LATTICE_SIZE
+    cj = w.cj
+    np.copyto(cj, j, casting="unsafe")
+    cj %= LATTICE_SIZE
+    value = w.value
+    value[...] = 0
+    if derivatives:
+        dx, dy = w.dx, w.dy
+        dx[...] = 0
+        dy[...] = 0
+    for oi, oj, c in ((0, 0, 0), (i1, j1, 1), (1, 1, 2)):
+        cx = np.subtract(x0, oi, out=w.cx)
+        cx += c * G2
+        cy = np.subtract(y0, oj, out=w.cy)
+        cy += c * G2
+        # Indices stay below 2 * LATTICE_SIZE: mode="wrap" skips the checks
+        np.add(cj, oj, out=w.h)
+        h = np.take(perm, w.h, out=w.h2, mode="wrap")
+        h += ci
+        h += oi
+        r = np.multiply(cx, cx, out=w.r)
+        r += np.multiply(cy, cy, out=tmp)
+        np.subtract(0.5, r, out=r)
+        np.maximum(r, 0, out=r)
+        # Without derivatives, the gradient buffers are tmp
+        cgx = np.take(gx, h, out=w.cgx, mode="wrap")
+        dot = np.multiply(cgx, cx, out=w.dot)
+        cgy = np.take(gy, h, out=w.cgy, mode="wrap")
+        dot += np.multiply(cgy, cy, out=tmp)
+        if derivatives:
+            q = np.multiply(r, r, out=w.q)
+            q *= r
+            q *= dot
+            q *= 8
+        r4 = np.multiply(r, r, out=r)
+        r4 *= r4
+        value += np.multiply(r4, dot, out=tmp)
+        if derivatives:
+            dx += np.multiply(r4, cgx, out=tmp)
+            dx -= np.multiply(q, cx, out=tmp)
+            dy += np.multiply(r4, cgy, out=tmp)
+            dy -= np.multiply(q, cy, out=tmp)
+    value *= 70
+    if derivatives:
+        dx *= 70
+        dy *= 70
+        return value, dx, dy
+    return value, None, None
+
+def simplex_3d(x, y, z, field, derivatives=False, work=None):
+    """
+    One octave of 3D simplex noise.
+    :param x: X coordinates
+    :param y: Y coordinates
+    :param z: Z (time) coordinates
+    :param field: SimplexField giving the gradients
+    :param derivatives: Also compute the partial derivatives along x and y
+    :param work: SimplexBuffers of the broadcast shape, in 3D (allocated in
+                 float64 if None)
+    :return: (values, d/dx, d/dy), the derivatives being None if not asked.
+             The arrays belong to work and are overwritten by its next use
+    """
+    if work is None:
+        work = SimplexBuffers(np.broadcast_shapes(np.shape(x), np.shape(y),
+                                                  np.shape(z)),
+                              3, derivatives)
+    w = work
+    perm = field.perm
+    gx, gy, gz = field.composed_gradients_3d.astype(w.tmp.dtype, copy=False)
+    tmp = w.tmp
+    s = np.add(x, y, out=w.x0)
+    s += z
+    s *= F3
+    i = np.add(x, s, out=w.cx)
+    np.floor(i, out=i)
+    j = np.add(y, s, out=w.cy)
+    np.floor(j, out=j)
+    k = np.add(z, s, out=w.cz)
+    np.floor(k, out=k)
+    t = np.add(i, j, out=tmp)
+    t += k
+    t *= G3
+    x0 = np.subtract(x, i, out=w.x0)
+    x0 += t
+    y0 = np.subtract(y, j, out=w.y0)
+    y0 += t
+    z0 = np.subtract(z, k, out=w.z0)
+    z0 += t
+    # The simplex is walked along the coordinates sorted by decreasing value
+    x_ge_y = np.greater_equal(x0, y0, out=w.x_ge_y)
+    x_ge_z = np.greater_equal(x0, z0, out=w.x_ge_z)
+    y_ge_z = np.greater_equal(y0, z0, out=w.y_ge_z)
+    y_gt_x = np.logical_not(x_ge_y, out=w.y_gt_x)
+    i1 = np.logical_and(x_ge_y, x_ge_z, out=w.i1)
+    j1 = np.logical_and(y_gt_x, y_ge_z, out=w.j1)
+    i2 = np.logical_or(x_ge_y, x_ge_z, out=w.i2)
+    j2 = np.logical_or(y_gt_x, y_ge_z, out=w.j2)
+    # k1 = ~x_ge_z & ~y_ge_z and k2 = ~x_ge_z | ~y_ge_z
+    k1 = np.logical_or(x_ge_z, y_ge_z, out=w.k1)
+    np.logical_not(k1, out=k1)
+    k2 = np.logical_and(x_ge_z, y_ge_z, out=w.k2)
+    np.logical_not(k2, out=k2)
+    ci, cj, ck = w.ci, w.cj, w.ck
+    for cell, floor in ((ci, i), (cj, j), (ck, k)):
+        np.copyto(cell, floor, casting="unsafe")
+        cell %= LATTICE_SIZE
+    value = w.value
+    value[...] = 0
+    if derivatives:
+        dx, dy = w.dx, w.dy
+        dx[...] = 0
+        dy[...] = 0
+    for c, (oi, oj, ok) in enumerate(((0, 0, 0), (i1, j1, k1), (i2, j2, k2),
+                                      (1, 1, 1))):
+        cx = np.subtract(x0, oi, out=w.cx)
+        cx += c * G3
+        cy = np.subtract(y0, oj, out=w.cy)
+        cy += c * G3
+        cz = np.subtract(z0, ok, out=w.cz)
+        cz += c * G3
+        np.add(ck, ok, out=w.h)
+        h = np.take(perm, w.h, out=w.h2, mode="wrap")
+        h += cj
+        h += oj
+        h = np.take(perm, h, out=w.h, mode="wrap")
+        h += ci
+        h += oi
+        # r^2 = 0.5 keeps each kernel inside the simplices sharing its corner,
+        # larger radii leak past them and make the noise discontinuous
+        r = np.multiply(cx, cx, out=w.r)
+        r += np.multiply(cy, cy, out=tmp)
+        r += np.multiply(cz, cz, out=tmp)
+        np.subtract(0.5, r, out=r)
+        np.maximum(r, 0, out=r)
+        cgx = np.take(gx, h, out=w.cgx, mode="wrap")
+        dot = np.multiply(cgx, cx, out=w.dot)
+        cgy = np.take(gy, h, out=w.cgy, mode="wrap")
+        dot += np.multiply(cgy, cy, out=tmp)
+        cgz = np.take(gz, h, out=w.cgz, mode="wrap")
+        dot += np.multiply(cgz, cz, out=tmp)
+        if derivatives:
+            q = np.multiply(r, r, out=w.q)
+            q *= r
+            q *= dot
+            q *= 8
+        r4 = np.multiply(r, r, out=r)
+        r4 *= r4
+        value += np.multiply(r4, dot, out=tmp)
+        if derivatives:
+            dx += np.multiply(r4, cgx, out=tmp)
+            dx -= np.multiply(q, cx, out=tmp)
+            dy += np.multiply(r4, cgy, out=tmp)
+            dy -= np.multiply(q, cy, out=tmp)
+    value *= 84
+    if derivatives:
+        dx *= 84
+        dy *= 84
+        return value, dx, dy
+    return value, None, None
+
+def perlin_noise_parallel(width, height, scale=100, seed=None, field=None,
+                          octaves=6, persistence=0.5, lacunarity=2.0,
+                          dtype=np.float64, workers=None, bands=None,
+                          backend="random"):
+    """
+    Generate 2D Perlin noise on several processes.
+    The map is cut into row bands computed by a ProcessPoolExecutor. Each
+    worker writes its band straight into a shared memory array, so only the
+    (small) lattice is pickled. The result is identical to perlin_noise with
+    the same field.
+    :param width: Width of the noise array
+    :param height: Height of the noise array
+    :param scale: Scale of the noise pattern
+    :param seed: Seed of the gradient lattice (ignored if field is given)
+    :param field: Noise field to sample, shared by all octaves
+    :param octaves: Number of octaves summed
+    :param persistence: Amplitude ratio between two octaves
+    :param lacunarity: Frequency ratio between two octaves
+    :param dtype: Floating type of the result
+    :param workers: Number of processes (os.cpu_count() if None)
+    :param bands: Number of row bands (4 per worker if None)
+    :param backend: Noise backend of the field (ignored if field is given)
+    :return: 2D numpy array of Perlin noise
+    """
+    if field is None:
+        field = make_field(seed, backend)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if bands is None:
+        bands = 4 * workers
+    bands = max(1, min(bands, height))
+    dtype = np.dtype(dtype)
+    shape = (height, width)
+    edges = np.linspace(0, height, bands + 1).astype(int)
+    shm = shared_memory.SharedMemory(create=True,
+                                     size=max(1, height * width * dtype.itemsize))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_perlin_band, shm.name, shape, dtype,
+                                       row0, row1, width, height, field, scale,
+                                       octaves, persistence, lacunarity)
+                       for row0, row1 in zip(edges[:-1], edges[1:])
+                       if row1 > row0]
+            for future in futures:
+                future.result()
+        noise = np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
     # Normalize the noise to [0, 1]
-    noise = (noise - np.min(noise)) / (np.max(noise) - np.min(noise))
+    noise -= np.min(noise)
+    noise /= np.max(noise)
     return noise
 
-def perlin_noise_2d(x, y):
+def _perlin_band(shm_name, shape, dtype, row0, row1, width, height, field,
+                 scale, octaves, persistence, lacunarity):
+    """
+    Worker of perlin_noise_parallel: compute rows [row0, row1) of the raw
+    fBm directly into the shared memory array.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        noise = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        x = np.linspace(0, 1, width, endpoint=False)
+        y = np.linspace(0, 1, height, endpoint=False)
+        field.fbm(x[np.newaxis, :], y[row0:row1, np.newaxis],
+                  scale=scale, octaves=octaves, persistence=persistence,
+                  lacunarity=lacunarity, dtype=dtype, out=noise[row0:row1])
+        del noise
+    finally:
+        shm.close()
+
+def sample_fbm_bounds(field, scale=100, octaves=6, persistence=0.5,
+                      lacunarity=2.0, samples=256, margin=0.1):
+    """
+    Estimate the range of perlin_fbm over the unit square from a coarse
+    sample grid, so that tiles can be normalized without a full-array pass.
+    :param field: Noise field to sample
+    :param scale: Frequency of the first octave
+    :param octaves: Number of octaves summed
+    :param persistence: Amplitude ratio between two octaves
+    :param lacunarity: Frequency ratio between two octaves
+    :param samples: Number of samples along each axis
+    :param margin: Fraction of the sampled range added on both sides
+    :return: (low, high) bounds
+    """
+    s = (np.arange(samples) + 0.5) / samples
+    noise = field.fbm(s[np.newaxis, :], s[:, np.newaxis], scale=scale,
+                      octaves=octaves, persistence=persistence,
+                      lacunarity=lacunarity)
+    low, high = np.min(noise), np.max(noise)
+    pad = margin * (high - low)
+    return low - pad, high + pad
+
+def perlin_noise_tiles(width, height, tile_size=1024, scale=100, seed=None,
+                       field=None, octaves=6, persistence=0.5, lacunarity=2.0,
+                       dtype=np.float64, bounds="sampled", out=None,
+                       backend="random"):
+    """
+    Generate a large Perlin noise map one tile at a time.
+    Every tile samples the same global coordinates as perlin_noise, so tiles
+    join without seams. They are normalized with fixed bounds instead of the
+    min/max of the whole map, then clipped to [0, 1].
+    :param width: Width of the noise map
+    :param height: Height of the noise map
+    :param tile_size: Side of the (square) tiles
+    :param scale: Scale of the noise pattern
+    :param seed: Seed of the gradient lattice (ignored if field is given)
+    :param field: Noise field to sample, shared by all tiles
+    :param octaves: Number of octaves summed
+    :param persistence: Amplitude ratio between two octaves
+    :param lacunarity: Frequency ratio between two octaves
+    :param dtype: Floating type of the tiles
+    :param bounds: "sampled" (sample_fbm_bounds), "analytic"
+                   (field.fbm_bound) or an explicit (low, high) pair
+    :param out: Optional (height, width) array, e.g. a memory map, in which
+                every tile is also written
+    :param backend: Noise backend of the field (ignored if field is given)
+    :return: Generator of (row, col, tile) with the tile's top-left corner
+    """
+    if field is None:
+        field = make_field(seed, backend)
+    if isinstance(bounds, str):
+        if bounds == "sampled":
+            low, high = sample_fbm_bounds(field, scale=scale, octaves=octaves,
+                                          persistence=persistence,
+                                          lacunarity=lacunarity)
+        elif bounds == "analytic":
+            high = field.fbm_bound(octaves=octaves, persistence=persistence)
+            low = -high
+        else:
+            raise ValueError(f"Unknown bounds: {bounds}")
+    else:
+        low, high = bounds
+    x = np.linspace(0, 1, width, endpoint=False)
+    y = np.linspace(0, 1, height, endpoint=False)
+    for row in range(0, height, tile_size):
+        for col in range(0, width, tile_size):
+            tile = field.fbm(x[np.newaxis, col:col + tile_size],
+                             y[row:row + tile_size, np.newaxis],
+                             scale=scale, octaves=octaves,
+                             persistence=persistence, lacunarity=lacunarity,
+                             dtype=dtype)
+            tile -= low
+            tile /= high - low
+            np.clip(tile, 0, 1, out=tile)
+            if out is not None:
+                out[row:row + tile.shape[0], col:col + tile.shape[1]] = tile
+            yield row, col, tile
+
+def perlin_noise_to_npy(path, width, height, tile_size=1024, dtype=np.float64,
+                        **kwargs):
+    """
+    Write a Perlin noise map to a memory-mapped .npy file tile by tile, so
+    that only one tile is held in memory at a time.
+    :param path: Path of the .npy file
+    :param width: Width of the noise map
+    :param height: Height of the noise map
+    :param tile_size: Side of the (square) tiles
+    :param dtype: Floating type stored in the file
+    :param kwargs: Other arguments of perlin_noise_tiles
+    :return: The memory map, opened in read/write mode
+    """
+    noise = np.lib.format.open_memmap(path, mode="w+", dtype=dtype,
+                                      shape=(height, width))
+    for _ in perlin_noise_tiles(width, height, tile_size=tile_size,
+                                dtype=dtype, out=noise, **kwargs):
+        pass
+    noise.flush()
+    return noise
+
+class ScrollingNoise:
+    """
+    Sliding window over an infinite, seeded noise field.
+    Pixel (col, row) samples the field at (col / extent[0], row / extent[1]),
+    so a window at (0, 0) lies on the same coordinates as a map of size
+    extent. Moving the window only computes the newly exposed strips, and
+    values are normalized with fixed bounds (clipped to [0, 1]), so they are
+    the same as those of a window created directly at the new position.
+    :param width: Width of the window
+    :param height: Height of the window
+    :param scale: Scale of the noise pattern
+    :param seed: Seed of the field (ignored if field is given)
+    :param field: Noise field to sample
+    :param octaves: Number of octaves summed
+    :param persistence: Amplitude ratio between two octaves
+    :param lacunarity: Frequency ratio between two octaves
+    :param dtype: Floating type of the window
+    :param backend: Noise backend of the field (ignored if field is given)
+    :param extent: Pixels per unit coordinate along x and y ((width, height)
+                   if None)
+    :param bounds: (low, high) raw values mapped to 0 and 1 (estimated with
+                   sample_fbm_bounds if None)
+    :param col: First column of the window
+    :param row: First row of the window
+    """
+    def __init__(self, width, height, scale=100, seed=None, field=None,
+                 octaves=6, persistence=0.5, lacunarity=2.0,
+                 dtype=np.float64, backend="random", extent=None, bounds=None,
+                 col=0, row=0):
+        if field is None:
+            field = make_field(seed, backend)
+        self.field = field
+        self.width = width
+        self.height = height
+        self.fbm_params = dict(scale=scale, octaves=octaves,
+                               persistence=persistence, lacunarity=lacunarity,
+                               dtype=dtype)
+        self.extent = (width, height) if extent is None else extent
+        if bounds is None:
+            bounds = sample_fbm_bounds(field, scale=scale, octaves=octaves,
+                                       persistence=persistence,
+                                       lacunarity=lacunarity)
+        self.bounds = bounds
+        self.col = col
+        self.row = row
+        self.values = self.render(col, col + width, row, row + height)
+
+    def render(self, col0, col1, row0, row1):
+        """
+        Compute the normalized noise of a block of pixels of the field.
+        :param col0: First column
+        :param col1: Column after the last one
+        :param row0: First row
+        :param row1: Row after the last one
+        :return: (row1 - row0, col1 - col0) array
+        """
+        x = np.arange(col0, col1) / self.extent[0]
+        y = np.arange(row0, row1) / self.extent[1]
+        low, high = self.bounds
+        block = self.field.fbm(x[np.newaxis, :], y[:, np.newaxis],
+                               **self.fbm_params)
+        block -= low
+        block /= high - low
+        np.clip(block, 0, 1, out=block)
+        return block
+
+    def shift(self, dx, dy):
+        """
+        Move the window by dx columns and dy rows.
+        :param dx: Number of columns (positive to the right)
+        :param dy: Number of rows (positive downwards)
+        :return: The new window values
+        """
+        col, row = self.col + dx, self.row + dy
+        width, height = self.width, self.height
+        if abs(dx) >= width or abs(dy) >= height:
+            values = self.render(col, col + width, row, row + height)
+        else:
+            values = np.empty_like(self.values)
+            # Part of the old window still visible, in new window coordinates
+            c0, c1 = max(0, -dx), min(width, width - dx)
+            r0, r1 = max(0, -dy), min(height, height - dy)
+            values[r0:r1, c0:c1] = self.values[r0 + dy:r1 + dy, c0 + dx:c1 + dx]
+            # Exposed columns over the whole height, then exposed rows
+            # between them
+            if c0 > 0:
+                values[:, :c0] = self.render(col, col + c0, row, row + height)
+            if c1 < width:
+                values[:, c1:] = self.render(col + c1, col + width,
+                                             row, row + height)
+            if r0 > 0:
+                values[:r0, c0:c1] = self.render(col + c0, col + c1,
+                                                 row, row + r0)
+            if r1 < height:
+                values[r1:, c0:c1] = self.render(col + c0, col + c1,
+                                                 row + r1, row + height)
+        self.values = values
+        self.col, self.row = col, row
+        return values
+
+def backend_throughput(width=512, height=512, scale=5, octaves=6, repeat=3,
+                       backends=None, dtype=np.float64):
+    """
+    Measure the speed of perlin_noise for each backend.
+    :param width: Width of the generated maps
+    :param height: Height of the generated maps
+    :param scale: Scale of the noise pattern
+    :param octaves: Number of octaves summed
+    :param repeat: Number of timed runs, the best one is kept
+    :param backends: Names of the backends to measure (all if None)
+    :param dtype: Floating type of the maps
+    :return: Dictionary {backend: samples per second}
+    """
+    if backends is None:
+        backends = list(NOISE_BACKENDS)
+    throughput = {}
+    for backend in backends:
+        field = make_field(0, backend)
+        best = np.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            perlin_noise(width, height, scale=scale, field=field,
+                         octaves=octaves, dtype=dtype)
+            best = min(best, time.perf_counter() - start)
+        throughput[backend] = width * height / best
+    return throughput
+
+def perlin_noise_2d(x, y, field=None):
     """
     Generate 2D Perlin noise.
     :param x: X coordinates
     :param y: Y coordinates
+    :param field: PerlinField giving the gradient lattice (a new random one if None)
     :return: 2D numpy array of Perlin noise
     """
+    if field is None:
+        field = PerlinField()
     # Integer coordinates
     x0 = np.floor(x).astype(int)
     x1 = x0 + 1
@@ -45,11 +1070,11 @@ def perlin_noise_2d(x, y):
     u = smoothstep(tx)
     v = smoothstep(ty)
     # Gradients at the integer coordinates
-    gradients = np.random.randn(256, 2)
-    g00 = gradients[hash(x0, y0) % 256]
-    g01 = gradients[hash(x0, y1) % 256]
-    g10 = gradients[hash(x1, y0) % 256]
-    g11 = gradients[hash(x1, y1) % 256]
+    gradients = field.gradients
+    g00 = gradients[field.lattice_hash(x0, y0)]
+    g01 = gradients[field.lattice_hash(x0, y1)]
+    g10 = gradients[field.lattice_hash(x1, y0)]
+    g11 = gradients[field.lattice_hash(x1, y1)]
     # Vectors from the grid points to (x, y)
     dx00 = np.stack((tx, ty), axis=-1)
     dx01 = np.stack((tx, ty - 1), axis=-1)
@@ -67,14 +1092,6 @@ def perlin_noise_2d(x, y):
     wy = cubic(v)
     nxy = mix(nx0, nx1, wy)
     return nxy
-def hash(x, y):
-    """
-    Pseudo-random hash function.
-    :param x: X coordinate
-    :param y: Y coordinate
-    :return: Pseudo-random value
-    """
-    return (x * 1619 + y * 31337) % 65536
 def mix(a, b, t):
     """
     Linear interpolation.
@@ -98,8 +1115,17 @@ def cubic(t):
     :return: Interpolated value
     """
     return t * t * (3 - 2 * t)
+def fade_derivative(t):
+    """
+    Derivative of the interpolation weight cubic(smoothstep(t)).
+    :param t: Fractional coordinate
+    :return: d/dt cubic(smoothstep(t))
+    """
+    s = smoothstep(t)
+    return 36 * s * (1 - s) * t * (1 - t)
 
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
     # Dimensions de la matrice de bruit de Perlin
     m = 100
     n = 200
@@ -112,9 +1138,7 @@ if __name__ == "__main__":
         l_scale.append(np.random.randint(1, 16))
     l_weight = np.array(l_weight)
     l_weight = l_weight/np.linalg.norm(l_weight)
-    noise_matrix = np.zeros((m, n))
-    for i in range(n_scales):
-        noise_matrix += l_weight[i]*perlin_noise(n, m, scale=l_scale[i])
+    noise_matrix = perlin_noise_batch(n, m, l_scale, weights=l_weight)
     # Affichage du bruit de Perlin
     plt.imshow(noise_matrix, cmap='gray', interpolation='nearest')
     plt.colorbar()
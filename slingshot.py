@@ -4,6 +4,8 @@ import numpy as np
 import math
 import random
 import time
+import itertools
+from collections import OrderedDict
 from colorsys import hls_to_rgb
 
 pygame.init()
@@ -40,6 +42,7 @@ vdiv = 250/vinitmax
 dt = 0.5
 num_planets = 10
 coeff=2
+exact_gravity = False  # True : gravité calculée exactement à chaque pas (vérification de la grille)
 
 # Classe pour les objets gravitationnels (joueurs et planètes)
 class RoundObject:
@@ -81,6 +84,46 @@ class Planet(RoundObject):
         super().__init__(x, y, radius, color)
         self.weight = np.pi * self.radius**2
 
+# Planètes rangées dans des tableaux numpy (x, y, poids, rayon), pour calculer
+# la gravité de toutes les planètes sur toutes les balles en une seule opération
+class Planets:
+    versions = itertools.count()
+
+    def __init__(self, planets_list):
+        self.x = np.array([planet.x for planet in planets_list], dtype=float)
+        self.y = np.array([planet.y for planet in planets_list], dtype=float)
+        self.weight = np.array([planet.weight for planet in planets_list], dtype=float)
+        self.radius = np.array([planet.radius for planet in planets_list], dtype=float)
+        self.color = [planet.color for planet in planets_list]
+        self.grid = None  # GravityGrid, voir build_grid
+        self.version = next(Planets.versions)  # change à chaque modification des planètes
+
+    def __len__(self):
+        return len(self.x)
+
+    def disable(self, i):
+        # La planète i ne compte plus : ni gravité, ni collision
+        self.weight[i] = 0
+        self.color[i] = (40, 40, 40)
+        if self.grid is not None:
+            self.grid.update_planet(i)
+        self.version = next(Planets.versions)
+
+    def build_grid(self, width, height, spacing=4):
+        # Précalculer la gravité sur une grille couvrant la fenêtre
+        self.grid = GravityGrid(self, width, height, spacing)
+
+    def draw(self):
+        for x, y, radius, color in zip(self.x, self.y, self.radius, self.color):
+            pygame.draw.circle(screen, color, (int(x), int(y)), int(radius))
+
+    def check_collision(self, x, y):
+        # Pour chaque point (x, y), touche-t-il une planète active ?
+        x = np.asarray(x, dtype=float)[..., np.newaxis]
+        y = np.asarray(y, dtype=float)[..., np.newaxis]
+        hit = (np.hypot(x - self.x, y - self.y) < self.radius) & (self.weight != 0)
+        return hit.any(axis=-1)
+
 # Classe pour les balles
 class Bullet:
     def __init__(self, x, y, vx, vy, player, color, click_pos):
@@ -97,18 +140,13 @@ class Bullet:
         self.traj = [(self.x, self.y)]
         self.click_pos = click_pos
         
-    def update(self, planets_list):
+    def update(self, planets, position=None):
         # Mettre à jour la position de la balle en fonction de son angle et de sa vitesse
-        ax, ay = get_acceleraction(self.x, self.y, planets_list)
-        vx = self.vx*dt + ax*dt**2/2
-        vy = self.vy*dt + ay*dt**2/2
-        v = np.linalg.norm([vx, vy])
-        if v < vmin:
-            vx = vmin*vx/v
-            vy = vmin*vy/v
-        a = np.linalg.norm([ax, ay])
-        self.x = self.x + vx
-        self.y = self.y + vy
+        # position : nouvelle position déjà calculée par bullet_step pour toutes les balles
+        if position is None:
+            position = bullet_step(self.x, self.y, self.vx, self.vy, planets)
+        self.x = float(position[0])
+        self.y = float(position[1])
         self.traj.append((self.x, self.y))
 
     def draw(self):
@@ -123,26 +161,218 @@ class Bullet:
 def stair(a, astep):
     return (a//astep_planet)*astep_planet
     
-def get_acceleraction(x, y, planets_list):
-    ax = 0
-    ay = 0
-    for planet in planets_list:
-        d = np.linalg.norm([x-planet.x,
-                            y-planet.y])
-        ax += (planet.x-x) * planet.weight / d**(coeff+1) * g
-        ay += (planet.y-y) * planet.weight / d**(coeff+1) * g
-        a = np.linalg.norm(np.array([ax, ay]))
-        if a > amax_planet:
-            ax = amax_planet*ax/a
-            ay = amax_planet*ay/a
-        #a_new = stair(a, astep_planet)
-        #assert a_new <= a
-        #assert abs(a_new*ax/a) <= abs(ax)
-        #assert abs(a_new*ay/a) <= abs(ay)
-        #ax = a_new*ax/a
-        #ay = a_new*ay/a
+def planet_terms(x, y, planets, index=slice(None)):
+    # Accélération de chaque planète (sans limite) aux points (x, y) : tableaux (..., planètes)
+    x = np.asarray(x, dtype=float)[..., np.newaxis]
+    y = np.asarray(y, dtype=float)[..., np.newaxis]
+    dx = planets.x[index] - x
+    dy = planets.y[index] - y
+    d = np.sqrt(dx*dx + dy*dy)
+    # Au centre exact d'une planète (d == 0, ce qui arrive aux nœuds de GravityGrid),
+    # sa contribution est nulle au lieu de 0/0
+    d_power = d**(coeff+1)
+    tx = np.divide(dx * planets.weight[index], d_power, out=np.zeros(d.shape), where=d > 0) * g
+    ty = np.divide(dy * planets.weight[index], d_power, out=np.zeros(d.shape), where=d > 0) * g
+    return tx, ty
+
+def accumulate_terms(tx, ty):
+    # Somme des accélérations des planètes (dernier axe). Comme avant, la somme est
+    # limitée à amax_planet après chaque planète, dans l'ordre des planètes
+    n_planets = tx.shape[-1]
+    # Sommes partielles, planète après planète
+    ax = np.cumsum(tx, axis=-1)
+    ay = np.cumsum(ty, axis=-1)
+    over = np.hypot(ax, ay) > amax_planet
+    clamped = over.any(axis=-1)
+    total_x = ax[..., -1].copy() if n_planets else np.zeros(clamped.shape)
+    total_y = ay[..., -1].copy() if n_planets else np.zeros(clamped.shape)
+    if np.any(clamped):
+        # Jusqu'au premier dépassement la somme n'est pas limitée ; ensuite on reprend
+        # l'accumulation planète par planète, seulement pour les points concernés
+        first = np.argmax(over[clamped], axis=-1)
+        rows = np.flatnonzero(clamped)
+        tx = tx[clamped]
+        ty = ty[clamped]
+        sx = np.where(first > 0, ax[clamped, first - 1], 0)
+        sy = np.where(first > 0, ay[clamped, first - 1], 0)
+        for p in range(first.min(), n_planets):
+            active = first <= p
+            sx = np.where(active, sx + tx[:, p], sx)
+            sy = np.where(active, sy + ty[:, p], sy)
+            a = np.hypot(sx, sy)
+            limit = active & (a > amax_planet)
+            sx = np.where(limit, amax_planet*sx/np.where(limit, a, 1), sx)
+            sy = np.where(limit, amax_planet*sy/np.where(limit, a, 1), sy)
+        total_x.reshape(-1)[rows] = sx
+        total_y.reshape(-1)[rows] = sy
+    return total_x, total_y
+
+def get_acceleraction(x, y, planets, exact=None):
+    # Accélération due aux planètes aux points (x, y), pour toutes les planètes d'un coup
+    # (tableau balles x planètes), ou lue dans la grille précalculée des planètes
+    # exact : ignorer la grille (exact_gravity si None), pour vérifier la grille
+    if exact is None:
+        exact = exact_gravity
+    if not exact and planets.grid is not None:
+        ax, ay = planets.grid.sample(x, y)
+    else:
+        ax, ay = accumulate_terms(*planet_terms(x, y, planets))
+    if ax.ndim == 0:
+        return float(ax), float(ay)
     return ax, ay
 
+# Grille d'accélération d'une disposition de planètes
+class GravityGrid:
+    # L'accélération est calculée une fois aux nœuds d'une grille (pas de spacing pixels),
+    # puis lue par interpolation bilinéaire ; hors de la grille, elle est calculée exactement
+    # Les contributions de chaque planète sont gardées (si elles tiennent dans max_bytes) :
+    # quand le poids d'une planète change, seule sa contribution est recalculée
+    def __init__(self, planets, width, height, spacing=4, max_bytes=64 * 2**20, chunk=4096):
+        self.planets = planets
+        self.spacing = spacing
+        self.chunk = chunk
+        self.grid_x = np.arange(0, width + spacing, spacing, dtype=float)
+        self.grid_y = np.arange(0, height + spacing, spacing, dtype=float)
+        shape = (len(self.grid_y), len(self.grid_x))
+        self.x, self.y = (a.ravel() for a in np.meshgrid(self.grid_x, self.grid_y))
+        self.ax = np.zeros(shape)
+        self.ay = np.zeros(shape)
+        self.terms = None
+        if 2 * self.x.size * len(planets) * 4 <= max_bytes:
+            self.terms = np.zeros((2, self.x.size, len(planets)), dtype=np.float32)
+        self.build()
+
+    def build(self):
+        # Calcul complet, par paquets de nœuds pour borner la mémoire
+        ax, ay = self.ax.reshape(-1), self.ay.reshape(-1)
+        for start in range(0, self.x.size, self.chunk):
+            stop = start + self.chunk
+            tx, ty = planet_terms(self.x[start:stop], self.y[start:stop], self.planets)
+            if self.terms is not None:
+                # Mêmes valeurs que update_planet, qui repart des contributions gardées
+                self.terms[0, start:stop] = tx
+                self.terms[1, start:stop] = ty
+                tx = self.terms[0, start:stop].astype(float)
+                ty = self.terms[1, start:stop].astype(float)
+            ax[start:stop], ay[start:stop] = accumulate_terms(tx, ty)
+        self.check()
+
+    def update_planet(self, i):
+        # Le poids de la planète i a changé
+        if self.terms is None:
+            self.build()
+            return
+        tx, ty = planet_terms(self.x, self.y, self.planets, index=slice(i, i + 1))
+        self.terms[0, :, i] = tx[:, 0]
+        self.terms[1, :, i] = ty[:, 0]
+        ax, ay = self.ax.reshape(-1), self.ay.reshape(-1)
+        for start in range(0, self.x.size, self.chunk):
+            stop = start + self.chunk
+            ax[start:stop], ay[start:stop] = accumulate_terms(self.terms[0, start:stop].astype(float),
+                                                              self.terms[1, start:stop].astype(float))
+        self.check()
+
+    def check(self):
+        # Une valeur non finie serait étalée par l'interpolation sur les cases voisines
+        assert np.all(np.isfinite(self.ax)) and np.all(np.isfinite(self.ay)), \
+            "accélération non finie dans la grille de gravité"
+
+    def sample(self, x, y):
+        shape = np.shape(x)
+        x = np.asarray(x, dtype=float).reshape(-1)
+        y = np.asarray(y, dtype=float).reshape(-1)
+        fx = x / self.spacing
+        fy = y / self.spacing
+        inside = (fx >= 0) & (fx <= len(self.grid_x) - 1) & (fy >= 0) & (fy <= len(self.grid_y) - 1)
+        j = np.clip(np.floor(fx).astype(np.intp), 0, len(self.grid_x) - 2)
+        i = np.clip(np.floor(fy).astype(np.intp), 0, len(self.grid_y) - 2)
+        wx = np.clip(fx - j, 0, 1)
+        wy = np.clip(fy - i, 0, 1)
+        values = []
+        for grid in (self.ax, self.ay):
+            values.append((1 - wx) * (1 - wy) * grid[i, j] + wx * (1 - wy) * grid[i, j+1]
+                          + (1 - wx) * wy * grid[i+1, j] + wx * wy * grid[i+1, j+1])
+        ax, ay = values
+        if not np.all(inside):
+            exact_x, exact_y = accumulate_terms(*planet_terms(x[~inside], y[~inside], self.planets))
+            ax[~inside] = exact_x
+            ay[~inside] = exact_y
+        return ax.reshape(shape), ay.reshape(shape)
+
+    def max_error(self, n=10000, seed=0):
+        # Écart maximal entre la grille et le calcul exact, hors des planètes
+        rng = np.random.default_rng(seed)
+        x = rng.uniform(0, self.grid_x[-1], n)
+        y = rng.uniform(0, self.grid_y[-1], n)
+        outside = ~(np.hypot(x[:, np.newaxis] - self.planets.x,
+                             y[:, np.newaxis] - self.planets.y) < self.planets.radius).any(axis=-1)
+        x, y = x[outside], y[outside]
+        grid_x, grid_y = self.sample(x, y)
+        exact_x, exact_y = accumulate_terms(*planet_terms(x, y, self.planets))
+        return float(np.max(np.hypot(grid_x - exact_x, grid_y - exact_y), initial=0))
+
+def bullet_step(x, y, vx, vy, planets):
+    # Nouvelle position de balles (tableaux ou nombres), sans modifier l'état du jeu
+    ax, ay = get_acceleraction(x, y, planets)
+    vx = vx*dt + ax*dt**2/2
+    vy = vy*dt + ay*dt**2/2
+    v = np.hypot(vx, vy)
+    slow = v < vmin
+    vx = np.where(slow, vmin*vx/np.where(slow, v, 1), vx)
+    vy = np.where(slow, vmin*vy/np.where(slow, v, 1), vy)
+    return x + vx, y + vy
+
+# Aperçu du tir visé par la souris
+class AimPreview:
+    # La trajectoire du tir est simulée avec bullet_step, sans toucher à l'état du jeu
+    # Les trajectoires sont gardées (LRU) par vitesse de lancement arrondie à quantum,
+    # position du tireur et version des planètes ; chaque image ne consacre que
+    # time_budget secondes à la simulation, une longue trajectoire se complète donc
+    # au fil des images
+    def __init__(self, quantum=0.02, time_budget=0.004, max_steps=2000, max_items=64):
+        self.quantum = quantum
+        self.time_budget = time_budget
+        self.max_steps = max_steps
+        self.max_items = max_items
+        self.cache = OrderedDict()
+
+    def launch(self, shooter, target):
+        # Vitesse du tir central vers target, limitée comme dans Bullet, puis arrondie
+        vx = (target[0] - shooter.x)/vdiv
+        vy = (target[1] - shooter.y)/vdiv
+        v = np.hypot(vx, vy)
+        if v > vinitmax:
+            vx = vinitmax*vx/v
+            vy = vinitmax*vy/v
+        return round(vx/self.quantum)*self.quantum, round(vy/self.quantum)*self.quantum
+
+    def trajectory(self, shooter, target, planets, players, width, height):
+        vx, vy = self.launch(shooter, target)
+        v = np.hypot(vx, vy)
+        if v == 0:
+            return []
+        key = (vx, vy, shooter.x, shooter.y, planets.version, width, height)
+        entry = self.cache.get(key)
+        if entry is None:
+            x = shooter.x + (shooter.radius + 10) * vx / v
+            y = shooter.y + (shooter.radius + 10) * vy / v
+            entry = {"traj": [(x, y)], "done": False}
+            self.cache[key] = entry
+            while len(self.cache) > self.max_items:
+                self.cache.popitem(last=False)
+        self.cache.move_to_end(key)
+        traj = entry["traj"]
+        deadline = time.perf_counter() + self.time_budget
+        while not entry["done"] and time.perf_counter() < deadline:
+            x, y = bullet_step(*traj[-1], vx, vy, planets)
+            x, y = float(x), float(y)
+            traj.append((x, y))
+            entry["done"] = (not (0 <= x <= width and 0 <= y <= height)
+                             or bool(planets.check_collision(x, y))
+                             or any(dist(x, y, player.x, player.y) < player.radius for player in players)
+                             or len(traj) > self.max_steps)
+        return traj
+
 # Initialisation des joueurs et des planètes
 nx = 5
 ny = 3
@@ -156,39 +386,91 @@ player1 = Player(x=WIDTH * (nx-1) // nx,
                  radius=player_radius,
                  color=GREEN)
 players_list = [player0, player1]
-planets_list = []
+planets = Planets([])
 
 
 def dist(x1, y1, x2, y2):
     return np.sqrt((x1-x2)**2+(y1-y2)**2)
 
+def place_planets(num_planets, width, height, players, first=None, radius_range=(20, 40),
+                  fact=1.5, attempts_per_planet=2, tries_per_neighbor=15):
+    # Placer au plus num_planets planètes (x, y, rayon) sans chevauchement
+    # Distances minimales : 2*r + r_joueur + 40 aux joueurs, 2*r + 2*r_planète + 10 entre planètes
+    # Les planètes déjà placées sont rangées dans une table de hachage spatiale (cases de
+    # la plus grande distance minimale possible) : chaque essai ne regarde que 3x3 cases
+    # 1. Tirage uniforme, avec un nombre d'essais borné
+    # 2. S'il manque des planètes, remplissage de type Poisson-disk (Bridson) autour des
+    #    planètes placées, jusqu'à ce qu'aucune n'ait plus de voisine possible
+    # Le placement se termine donc toujours ; s'il renvoie moins de num_planets planètes,
+    # la densité demandée n'est pas atteignable dans la fenêtre
+    r_min, r_max = radius_range
+    cell = 2*r_max + 2*max(r_max, first[2] if first is not None else 0) + 10
+    grid = {}
+    placed = []
+
+    def fits(x, y, radius):
+        if not (fact*radius <= x <= width - fact*radius and fact*radius <= y <= height - fact*radius):
+            return False
+        for player in players:
+            if math.hypot(x - player.x, y - player.y) < 2*radius + player.radius + 40:
+                return False
+        cx, cy = int(x // cell), int(y // cell)
+        for i in (cx - 1, cx, cx + 1):
+            for j in (cy - 1, cy, cy + 1):
+                for px, py, pr in grid.get((i, j), ()):
+                    if math.hypot(x - px, y - py) < 2*radius + 2*pr + 10:
+                        return False
+        return True
+
+    def add(x, y, radius):
+        grid.setdefault((int(x // cell), int(y // cell)), []).append((x, y, radius))
+        placed.append((x, y, radius))
+
+    if first is not None:
+        add(*first)
+    for _ in range(attempts_per_planet * num_planets):
+        if len(placed) >= num_planets:
+            break
+        radius = random.randint(r_min, r_max)
+        if width - fact*radius < fact*radius or height - fact*radius < fact*radius:
+            continue
+        x = random.randint(int(fact*radius), int(width-fact*radius))
+        y = random.randint(int(fact*radius), int(height-fact*radius))
+        if fits(x, y, radius):
+            add(x, y, radius)
+    active = list(range(len(placed)))
+    while active and len(placed) < num_planets:
+        a = random.randrange(len(active))
+        ax, ay, ar = placed[active[a]]
+        for _ in range(tries_per_neighbor):
+            radius = random.randint(r_min, r_max)
+            gap = 2*radius + 2*ar + 10
+            rho = random.uniform(gap, 2*gap)
+            angle = random.uniform(0, 2*math.pi)
+            x = int(round(ax + rho*math.cos(angle)))
+            y = int(round(ay + rho*math.sin(angle)))
+            if fits(x, y, radius):
+                add(x, y, radius)
+                active.append(len(placed) - 1)
+                break
+        else:
+            active[a] = active[-1]
+            active.pop()
+    return placed
+
 def initialize_planets():
-    global planets_list
+    global planets
     planets_list = []
-    planets_list = [Planet(WIDTH//2+random.randint(-30, 30),
-                           HEIGHT//2+random.randint(-30, 30),
-                           30,
-                           PLANET_COLOR())]
-    while len(planets_list) < num_planets:
-        radius = random.randint(20, 40)
-        fact = 1.5
-        x = random.randint(int(fact*radius), int(WIDTH-fact*radius))
-        y = random.randint(int(fact*radius), int(HEIGHT-fact*radius))
-        intersection = False
-        for player in players_list:
-            if dist(x, y, player.x, player.y) < 2*radius + player.radius + 40:
-                intersection = True
-        for planet in planets_list:
-            if dist(x, y, planet.x, planet.y) < 2*radius + 2*planet.radius + 10:
-                intersection = True
-        if not intersection:
-            color = PLANET_COLOR()
-            planet = Planet(x, y, radius, color)
-            planets_list.append(planet)
+    first = (WIDTH//2+random.randint(-30, 30), HEIGHT//2+random.randint(-30, 30), 30)
+    placed = place_planets(num_planets, WIDTH, HEIGHT, players_list, first=first)
+    if len(placed) < num_planets:
+        print(f"Seulement {len(placed)} planètes sur {num_planets} tiennent dans la fenêtre {WIDTH}x{HEIGHT}")
+    planets_list = [Planet(x, y, radius, PLANET_COLOR()) for x, y, radius in placed]
     planets_list[1:] = sorted(planets_list[1:], key=lambda planet : planet.weight)
     #planets_list = sorted(planets_list, key=lambda planet : planet.weight)
     planets_list.reverse()
-    assert len(planets_list) == num_planets
+    planets = Planets(planets_list)
+    planets.build_grid(WIDTH, HEIGHT)
 initialize_planets()
 
 # Boucle principale du jeu
@@ -197,6 +479,7 @@ clock = pygame.time.Clock()
 
 who_plays = 0
 
+aim_preview = AimPreview()
 bullets_list = []
 bullet_traj_list = []
 old_crosses = []
@@ -256,8 +539,14 @@ while running:
     for i in range(0, HEIGHT, 20):
         pygame.draw.lines(screen, DARK_BLUE, False, [(0, i), (WIDTH, i)], 1)
     
-    for planet in planets_list:
-        planet.draw()
+    planets.draw()
+
+    # Aperçu du prochain tir
+    if len(bullets_list) == 0:
+        preview_traj = aim_preview.trajectory(players_list[who_plays], pygame.mouse.get_pos(),
+                                              planets, players_list, WIDTH, HEIGHT)
+        if len(preview_traj) > 1:
+            pygame.draw.lines(screen, GREY, False, preview_traj, 1)
 
     for bullet in bullets_list:
         bullet.draw()
@@ -329,14 +618,23 @@ while running:
     # Mettre à jour et dessiner les balles des joueurs
     collision_player_0 = False
     collision_player_1 = False
+    # Toutes les balles avancent ensemble
+    new_x, new_y = bullet_step(np.array([bullet.x for bullet in bullets_list]),
+                               np.array([bullet.y for bullet in bullets_list]),
+                               np.array([bullet.vx for bullet in bullets_list]),
+                               np.array([bullet.vy for bullet in bullets_list]),
+                               planets)
+    for bullet, position in zip(list(bullets_list), zip(new_x, new_y)):
+        bullet.update(planets, position)
+    hits = planets.check_collision([bullet.x for bullet in bullets_list],
+                                   [bullet.y for bullet in bullets_list])
+    for bullet, hit in zip(list(bullets_list), hits):
+        if hit:
+            bullets_list.remove(bullet)
+            bullet_traj_list.append({"traj":bullet.traj,
+                                     "pos":bullet.click_pos,
+                                     "color":bullet.color})
     for bullet in bullets_list:
-        bullet.update(planets_list)
-        for planet in planets_list:
-            if bullet.check_collision(planet) and planet.weight != 0:
-                bullets_list.remove(bullet)
-                bullet_traj_list.append({"traj":bullet.traj,
-                                         "pos":bullet.click_pos,
-                                         "color":bullet.color})
         bullet.draw()
         if bullet.check_collision(player1):
             collision_player_1 = True
@@ -359,8 +657,8 @@ while running:
     k = 6
     # n_test != 0 and n_test%k == 0 and n_test//k-1==n_test_k
     if (n_test_k+1)*k<n_test+1 and len(bullets_list)==0:
-        planets_list[n_test//k-1].weight = 0
-        planets_list[n_test//k-1].color = (40, 40, 40)
+        if n_test//k-1 < len(planets):
+            planets.disable(n_test//k-1)
         for i in range(len(bullet_traj_list)):
             bullet_traj_list[i]['color'] = np.array(bullet_traj_list[i]['color'])/2
         n_test_k += 1